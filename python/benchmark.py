@@ -0,0 +1,259 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+from PIL import Image
+
+import palettemaker
+import palette_clustering
+import texturemaker
+import paletteblueprintmaker
+import image_rotator
+
+# Benchmarks for the palette -> texture -> blueprint pipeline on synthetic inputs.
+# Run `python benchmark.py --output results.json`, then later
+# `python benchmark.py --baseline results.json` to check for regressions.
+
+DEFAULT_SWEEPS = {
+    "get_color_frequencies": [64, 256, 1024, 2048],  # image side in pixels
+    "reduce_colors": [100, 400, 1000],  # colors reduced to 10
+    "cluster_colors": [10000, 100000, 1000000],  # histogram colors clustered into CLUSTER_COUNT
+    "process_textures": [100, 1000, 5000],  # PNG files
+    "get_all_texture_names": [100, 1000, 5000],  # texture JSON files
+    "create_palette_blueprint": [100, 1000, 5000],  # texture JSON files
+    "rotate_images_in_folder": [50, 200],  # images
+}
+
+QUICK_SWEEPS = {
+    "get_color_frequencies": [64, 256],
+    "reduce_colors": [100],
+    "cluster_colors": [10000],
+    "process_textures": [100],
+    "get_all_texture_names": [100],
+    "create_palette_blueprint": [100],
+    "rotate_images_in_folder": [20],
+}
+
+DEFAULT_UNIQUE_COLORS = [16, 4096]
+
+# Strip height for the tiled variant of the frequency stage
+TILE_ROWS = 256
+
+# Colors the clustering stage reduces its histograms to
+CLUSTER_COUNT = 32
+
+# The per-pixel engine is far too slow to sweep over large images
+MAX_PIXEL_ENGINE_SIDE = 512
+
+def make_palette_image(side, unique_colors, seed=0):
+    """Create a square RGBA image drawing every pixel from a fixed number of random colors."""
+    rng = random.Random(seed)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255) for _ in range(unique_colors)]
+    image = Image.new('RGBA', (side, side))
+    image.putdata([colors[rng.randrange(unique_colors)] for _ in range(side * side)])
+    return image
+
+def make_color_list(count, seed=0):
+    """Create a list of distinct random RGBA colors."""
+    rng = random.Random(seed)
+    colors = set()
+    while len(colors) < count:
+        colors.add((rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.choice((128, 255))))
+    return sorted(colors)
+
+def make_texture_folder(path, count, size=(1, 1)):
+    """Fill a folder with count solid-color PNGs named 0.png, 1.png, ..."""
+    os.makedirs(path, exist_ok=True)
+    for i, color in enumerate(make_color_list(count)):
+        Image.new('RGBA', size, color).save(os.path.join(path, f"{i}.png"))
+
+def make_texture_json_folder(path, count):
+    """Fill a folder with count texture JSON files, as texturemaker writes them."""
+    os.makedirs(path, exist_ok=True)
+    render = texturemaker.compile_texture_template(texturemaker.get_texture_template())
+    for i in range(count):
+        with open(os.path.join(path, f"{i}.json"), 'w') as f:
+            f.write(render(f"{i}.png", f"Benchmark-{i}"))
+
+def time_call(function, repeat=3, setup=None):
+    """Return the best wall time of several calls, with the scripts' printing silenced."""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+    return best
+
+def bench_get_color_frequencies(workdir, side, unique_colors, repeat):
+    image = make_palette_image(side, unique_colors)
+    ignore_colors = [(0, 0, 0, 255), (255, 255, 255, 255), (0, 0, 0, 0)]
+    results = []
+    for engine, count_frequencies in palettemaker.FREQUENCY_ENGINES.items():
+        if engine == "pixel" and side > MAX_PIXEL_ENGINE_SIDE:
+            continue
+        seconds = time_call(lambda: count_frequencies(image, ignore_colors, 0, "full"), repeat)
+        results.append({"variant": engine, "unique_colors": unique_colors, "seconds": seconds})
+    seconds = time_call(lambda: palettemaker.get_color_frequencies_vectorized(image, ignore_colors, 0, "full", tile_rows=TILE_ROWS), repeat)
+    results.append({"variant": "vectorized tiled", "unique_colors": unique_colors, "seconds": seconds})
+    return results
+
+def bench_reduce_colors(workdir, count, unique_colors, repeat):
+    colors = make_color_list(count)
+    percentages = {color: 100 / count for color in colors}
+    seconds = time_call(lambda: palettemaker.reduce_colors(list(colors), dict(percentages), 10), repeat)
+    return [{"variant": "greedy", "seconds": seconds}]
+
+def bench_cluster_colors(workdir, count, unique_colors, repeat):
+    rng = np.random.default_rng(0)
+    # A weighted histogram of distinct opaque colors, like the one a photographic palette produces
+    packed = rng.choice(1 << 24, size=count, replace=False).astype(np.uint32) | np.uint32(0xFF000000)
+    channels = packed.view(np.uint8).reshape(-1, 4)
+    counts = rng.integers(1, 100, size=count)
+    return [
+        {"variant": f"{method} {color_space}", "seconds": time_call(lambda: palette_clustering.cluster_colors(channels, counts, CLUSTER_COUNT, method, color_space), repeat)}
+        for method in palette_clustering.CLUSTERING_METHODS
+        for color_space in palette_clustering.COLOR_SPACES
+    ]
+
+def bench_process_textures(workdir, count, unique_colors, repeat):
+    input_folder = os.path.join(workdir, "Textures")
+    output_folder = os.path.join(workdir, "Color Textures")
+    make_texture_folder(input_folder, count)
+    clear_output = lambda: shutil.rmtree(output_folder, ignore_errors=True)
+    return [
+        {"variant": "serial", "seconds": time_call(lambda: texturemaker.process_textures(input_folder, output_folder), repeat, clear_output)},
+        {"variant": "bulk", "seconds": time_call(lambda: texturemaker.process_textures_bulk(input_folder, output_folder), repeat, clear_output)},
+        {"variant": "bulk unchanged", "seconds": time_call(lambda: texturemaker.process_textures_bulk(input_folder, output_folder), repeat)},
+    ]
+
+def bench_get_all_texture_names(workdir, count, unique_colors, repeat):
+    folder = os.path.join(workdir, "Color Textures")
+    make_texture_json_folder(folder, count)
+    index_path = os.path.join(folder, paletteblueprintmaker.TEXTURE_INDEX_NAME)
+    clear_index = lambda: os.path.exists(index_path) and os.remove(index_path)
+    return [
+        {"variant": "no index", "seconds": time_call(lambda: paletteblueprintmaker.get_all_texture_names(folder, use_index=False), repeat)},
+        {"variant": "cold index", "seconds": time_call(lambda: paletteblueprintmaker.get_all_texture_names(folder), repeat, clear_index)},
+        {"variant": "warm index", "seconds": time_call(lambda: paletteblueprintmaker.get_all_texture_names(folder), repeat)},
+    ]
+
+def bench_create_palette_blueprint(workdir, count, unique_colors, repeat):
+    folder = os.path.join(workdir, "Color Textures")
+    make_texture_json_folder(folder, count)
+    seconds = time_call(lambda: paletteblueprintmaker.create_palette_blueprint(folder), repeat)
+    return [{"variant": "default", "seconds": seconds}]
+
+def bench_rotate_images_in_folder(workdir, count, unique_colors, repeat):
+    folder = os.path.join(workdir, "Textures")
+    make_texture_folder(folder, count, size=(64, 32))
+    output_folder = os.path.join(folder, "rotated")
+    clear_output = lambda: shutil.rmtree(output_folder, ignore_errors=True)
+    return [
+        {"variant": "serial", "seconds": time_call(lambda: image_rotator.rotate_images_in_folder(folder), repeat, clear_output)},
+        {"variant": "batch", "seconds": time_call(lambda: image_rotator.rotate_images_in_folder_batch(folder), repeat, clear_output)},
+        {"variant": "batch up to date", "seconds": time_call(lambda: image_rotator.rotate_images_in_folder_batch(folder), repeat)},
+    ]
+
+BENCHMARKS = {
+    "get_color_frequencies": bench_get_color_frequencies,
+    "reduce_colors": bench_reduce_colors,
+    "cluster_colors": bench_cluster_colors,
+    "process_textures": bench_process_textures,
+    "get_all_texture_names": bench_get_all_texture_names,
+    "create_palette_blueprint": bench_create_palette_blueprint,
+    "rotate_images_in_folder": bench_rotate_images_in_folder,
+}
+
+def run_benchmarks(stages, sweeps, unique_colors, repeat=3):
+    """Run each stage across its size sweep in a scratch folder, returning one record per measurement."""
+    results = []
+    for stage in stages:
+        for size in sweeps[stage]:
+            # Only the frequency stage depends on the number of unique colors
+            color_counts = unique_colors if stage == "get_color_frequencies" else [None]
+            for color_count in color_counts:
+                workdir = tempfile.mkdtemp(prefix="benchmark-")
+                try:
+                    for record in BENCHMARKS[stage](workdir, size, color_count, repeat):
+                        record = {"stage": stage, "size": size, **record}
+                        results.append(record)
+                        print(f"{stage:<26} {record['variant']:<18} size={size:<6} {format_params(record):<20} {record['seconds'] * 1000:10.2f} ms")
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def format_params(record):
+    """Describe the extra sweep parameters of a measurement."""
+    return f"colors={record['unique_colors']}" if record.get("unique_colors") is not None else ""
+
+def result_key(record):
+    """Identify a measurement across runs."""
+    return (record["stage"], record["variant"], record["size"], record.get("unique_colors"))
+
+def compare_results(results, baseline, tolerance):
+    """Print each measurement against the baseline and return the ones slower than the tolerance allows."""
+    baseline_times = {result_key(record): record["seconds"] for record in baseline["results"]}
+    regressions = []
+
+    print(f"\nComparison against baseline (tolerance {tolerance:.0%}):")
+    for record in results:
+        key = result_key(record)
+        if key not in baseline_times:
+            continue
+        old, new = baseline_times[key], record["seconds"]
+        ratio = new / old if old > 0 else float("inf")
+        status = "REGRESSION" if ratio > 1 + tolerance else ("faster" if ratio < 1 - tolerance else "")
+        print(f"{record['stage']:<26} {record['variant']:<18} size={record['size']:<6} {format_params(record):<20} {old * 1000:10.2f} ms -> {new * 1000:10.2f} ms  x{ratio:.2f} {status}")
+        if status == "REGRESSION":
+            regressions.append(record)
+    return regressions
+
+def parse_args(argv=None):
+    """Parse the benchmark command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the palette -> texture -> blueprint scripts on synthetic data.")
+    parser.add_argument("--stages", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), help="stages to run")
+    parser.add_argument("--quick", action="store_true", help="use a small size sweep")
+    parser.add_argument("--unique-colors", nargs="+", type=int, default=DEFAULT_UNIQUE_COLORS, help="unique colors in synthetic palettes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best is kept")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results previously written with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline, as a fraction")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sweeps = QUICK_SWEEPS if args.quick else DEFAULT_SWEEPS
+    results = run_benchmarks(args.stages, sweeps, args.unique_colors, args.repeat)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import instrumentation
+
+# Writes files on a thread pool so encoding and computing the next file overlap with disk latency.
+# At most max_pending writes are queued at a time; submitting more blocks until one finishes.
+# Every file is written to a temporary name and renamed into place, so readers never see half a file.
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PENDING = 64
+
+def write_file_atomic(path, write, mode='w'):
+    """Produce the file at path with write(f) through a temporary name next to it, returning its size.
+
+    The temporary name is unique to the process and thread, so concurrent writers of the same path
+    never replace each other's half-written files, and readers only ever see a whole file.
+    """
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, mode) as f:
+            write(f)
+            size = f.tell()
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+class BulkWriter:
+    """Background file writer with a bounded queue, atomic renames and one flush at the end."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Let queued writes finish, but don't hide the error that got us here behind a write error
+            self.executor.shutdown(wait=True)
+
+    def submit(self, path, write, mode='w'):
+        """Queue write(f) to produce the file at path, blocking while max_pending writes are queued."""
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self.write_atomic, path, write, mode)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(lambda done: self.finish(path, done))
+        return future
+
+    def write_atomic(self, path, write, mode):
+        """Write a file atomically and count it. Runs on a writer thread."""
+        size = write_file_atomic(path, write, mode)
+        instrumentation.count("files written")
+        instrumentation.count("bytes written", size)
+
+    def finish(self, path, future):
+        """Free the queue slot of a finished write and keep its error for flush."""
+        with self.lock:
+            self.pending.discard(future)
+            if future.exception() is not None:
+                self.errors.append((path, future.exception()))
+        self.slots.release()
+
+    def write_text(self, path, text):
+        """Queue a text file."""
+        return self.submit(path, lambda f: f.write(text))
+
+    def write_chunks(self, path, chunks):
+        """Queue a text file written from an iterable of strings, e.g. a streaming serializer."""
+        return self.submit(path, lambda f: f.writelines(chunks))
+
+    def save_image(self, path, image, format="PNG"):
+        """Queue encoding and saving a PIL image. The image must not be changed until it is written."""
+        return self.submit(path, lambda f: image.save(f, format=format), 'wb')
+
+    def flush(self):
+        """Wait for every queued write, then raise the first failure after reporting all of them."""
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+
+        with self.lock:
+            errors = self.errors
+            self.errors = []
+        for path, error in errors:
+            print(f"Failed to write {path}: {error}")
+        if errors:
+            raise errors[0][1]
+
+    def close(self):
+        """Flush and stop the writer threads."""
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import argparse
+import importlib
+import instrumentation
+import palette_cache
+
+# One entry point for the palette -> texture -> blueprint scripts, configured from the command line
+# instead of module constants. Each subcommand imports only what it needs, so e.g. regenerating
+# texture JSONs never loads PIL or numpy. `watch` stays in one process, so palettemaker, numpy and
+# PIL are imported once rather than per rebuild; palette analyses come from the on-disk palette cache.
+#
+#   python cli.py build "Kuromi X" palette.png --incremental
+#   python cli.py watch "Kuromi X" palette.png --interval 0.5
+
+def parse_color(text):
+    """Parse an "r,g,b,a" command line color."""
+    channels = tuple(int(channel) for channel in text.split(","))
+    if len(channels) != 4 or not all(0 <= channel <= 255 for channel in channels):
+        raise argparse.ArgumentTypeError(f"expected r,g,b,a with channels from 0 to 255, got '{text}'")
+    return channels
+
+def add_extraction_arguments(parser, scan_mode):
+    """Add the palette color extraction options shared by palette, build and watch."""
+    parser.add_argument("--threshold", type=float, default=0, help="average channel difference within which a color counts as ignored")
+    parser.add_argument("--max-colors", type=int, default=None, help="most colors to keep (default: all)")
+    parser.add_argument("--min-percentage", type=float, default=1.0, help="least share of the counted pixels a color needs")
+    parser.add_argument("--ignore", type=parse_color, nargs="*", default=None, metavar="R,G,B,A", help="colors to ignore")
+    parser.add_argument("--image-size", type=int, nargs=2, default=None, metavar=("W", "H"), help="size of each color texture")
+    parser.add_argument("--scan-mode", choices=["full", "row"], default=scan_mode, help="scan the whole image or only its first row/column")
+    parser.add_argument("--reduction", choices=["greedy", "median_cut", "kmeans"], default="greedy", help="how colors are reduced to --max-colors")
+    parser.add_argument("--color-space", choices=["rgba", "lab"], default="rgba", help="color space for median_cut and kmeans")
+    parser.add_argument("--no-cache", action="store_true", help="don't reuse or store palette analysis results")
+    parser.add_argument("--tile-rows", type=int, default=None, help="scan the palette in strips of this many rows (bounded memory for .npy palettes)")
+    parser.add_argument("--tile-workers", type=int, default=None, help="worker processes counting strips")
+
+def get_extraction_options(args):
+    """Turn the parsed extraction arguments into keyword arguments, leaving out unset ones."""
+    options = dict(
+        avg_difference_threshold=args.threshold,
+        max_colors=math.inf if args.max_colors is None else args.max_colors,
+        min_pixel_percentage=args.min_percentage,
+        scan_mode=args.scan_mode,
+        cache_dir=None if args.no_cache else palette_cache.DEFAULT_CACHE_DIR,
+        reduction_mode=args.reduction,
+        color_space=args.color_space,
+        tile_rows=args.tile_rows,
+        tile_workers=args.tile_workers,
+    )
+    if args.ignore is not None:
+        options["ignore_colors"] = args.ignore
+    if args.image_size is not None:
+        options["image_size"] = tuple(args.image_size)
+    return options
+
+def run_palette(args):
+    import palettemaker
+    import bulk_writer
+    with bulk_writer.BulkWriter() as writer:
+        palettemaker.process_palette(args.palette, args.output, output_mode=args.layout, writer=writer, **get_extraction_options(args))
+
+def run_textures(args):
+    import texturemaker
+    texture_name_function = lambda filename: args.prefix + texturemaker.remove_extension(filename) + args.suffix
+    texturemaker.process_textures_bulk(args.input, args.output, texture_name_function, workers=args.workers)
+
+def run_blueprint(args):
+    import bulk_writer
+    import paletteblueprintmaker
+    color_textures = paletteblueprintmaker.get_all_texture_names(args.color_textures)
+    shape_textures = paletteblueprintmaker.get_all_texture_names(args.shape_textures) if args.shape_textures else []
+
+    if os.path.exists(args.output) and not args.force:
+        raise FileExistsError(f"Blueprint folder {args.output} already exists, pass --force to overwrite it")
+    os.makedirs(args.output, exist_ok=True)
+    with bulk_writer.BulkWriter() as writer:
+        parts = paletteblueprintmaker.iter_palette_parts(color_textures, shape_textures)
+        paletteblueprintmaker.write_blueprint(os.path.join(args.output, "Blueprint.txt"), parts, writer)
+        writer.write_text(os.path.join(args.output, "Version.txt"), '"1.5.10.2"')
+    print(f"Blueprint created successfully at {args.output} ({len(color_textures) + len(shape_textures)} parts)")
+
+def run_rotate(args):
+    import image_rotator
+    image_rotator.rotate_images_in_folder_batch(args.folder, args.angle, workers=args.workers, force=args.force)
+
+def get_build_options(args):
+    """Turn the parsed build arguments into build_texture_pack keyword arguments."""
+    options = get_extraction_options(args)
+    options.update(
+        texture_pack_path=args.pack_path,
+        make_bp=not args.no_blueprint,
+        in_bp_path_or_saving=args.saving,
+        output_mode="atlas" if args.experimental_atlas else "images",
+        experimental_atlas=args.experimental_atlas,
+        incremental=args.incremental,
+    )
+    return options
+
+def run_build(args):
+    import texturepack_from_palette
+    timings = texturepack_from_palette.build_texture_pack(args.name, args.palette, **get_build_options(args))
+    print("Stages: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+
+def is_within(path, folders):
+    """Check whether a path is one of the given folders or inside one."""
+    path = os.path.abspath(path)
+    return any(path == folder or path.startswith(folder + os.sep) for folder in folders)
+
+def get_watch_state(paths, exclude=()):
+    """Return the size and modification time of every file under the given paths, skipping the excluded folders."""
+    exclude = [os.path.abspath(folder) for folder in exclude]
+    state = {}
+    for path in paths:
+        if os.path.isfile(path):
+            if not is_within(path, exclude):
+                stat = os.stat(path)
+                state[path] = (stat.st_mtime_ns, stat.st_size)
+            continue
+        for root, dirs, files in os.walk(path):
+            # Don't descend into excluded folders at all
+            dirs[:] = [folder for folder in dirs if not is_within(os.path.join(root, folder), exclude)]
+            if is_within(root, exclude):
+                continue
+            for file in files:
+                file_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                state[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+def run_watch(args):
+    """Rebuild a pack incrementally whenever its palette or any other watched path changes, until interrupted."""
+    import texturepack_from_palette
+    # Import palettemaker (and with it numpy and PIL) before the first build rather than during it;
+    # that, plus the on-disk palette cache, is all that carries over between rebuilds
+    importlib.import_module("palettemaker")
+
+    args.incremental = True
+    args.experimental_atlas = False
+    options = get_build_options(args)
+    watched = [args.palette] + args.also
+    # Everything the build writes, so a --also folder containing the pack doesn't trigger endless rebuilds
+    texture_pack_path = args.pack_path or os.path.join(texturepack_from_palette.TEXTURES_PATH, args.name)
+    outputs = [texture_pack_path, texturepack_from_palette.get_blueprint_path(args.name, texture_pack_path, args.saving)]
+    if not args.no_cache:
+        outputs.append(palette_cache.DEFAULT_CACHE_DIR)
+
+    print(f"Watching {', '.join(watched)} (Ctrl+C to stop)")
+    state = None
+    try:
+        while True:
+            current = get_watch_state(watched, outputs)
+            if current != state:
+                if state is not None:
+                    print("\nChange detected, rebuilding")
+                start = time.perf_counter()
+                instrumentation.reset()
+                try:
+                    texturepack_from_palette.build_texture_pack(args.name, args.palette, **options)
+                    print(f"Rebuilt {args.name} in {time.perf_counter() - start:.2f}s")
+                except Exception as e:
+                    # Keep watching; the next save usually fixes it
+                    print(f"Build failed: {type(e).__name__}: {e}")
+                instrumentation.finish_progress()
+                # Compare against what the build started from, so saves made while it ran trigger another build
+                state = current
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+
+def add_build_arguments(parser):
+    """Add the arguments shared by build and watch."""
+    parser.add_argument("name", help="texture pack name, also the texture name prefix")
+    parser.add_argument("palette", help="palette image (or .npy of RGBA pixels)")
+    parser.add_argument("--pack-path", help="texture pack folder (default: the game's texture packs folder)")
+    parser.add_argument("--no-blueprint", action="store_true", help="don't create the palette blueprint")
+    parser.add_argument("--saving", action="store_true", help="write the blueprint to Saving/Blueprints instead of the pack folder")
+    add_extraction_arguments(parser, scan_mode="row")
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Palette, texture, blueprint and rotation tools for Spaceflight Simulator texture packs.")
+    parser.add_argument("--output-mode", choices=instrumentation.OUTPUT_MODES, default="progress", help="per-item output")
+    parser.add_argument("--report", choices=["table", "json", "none"], default="none", help="report timers and counters at the end")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile")
+    parser.add_argument("--trace-memory", action="store_true", help="trace allocations with tracemalloc")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    palette = commands.add_parser("palette", help="extract a palette's colors into color images")
+    palette.add_argument("palette", help="palette image (or .npy of RGBA pixels)")
+    palette.add_argument("output", help="folder for the color images")
+    palette.add_argument("--layout", choices=["images", "atlas"], default="images", help="one image per color, or one atlas")
+    add_extraction_arguments(palette, scan_mode="full")
+    palette.set_defaults(handler=run_palette)
+
+    textures = commands.add_parser("textures", help="write a texture JSON for every PNG in a folder")
+    textures.add_argument("input", help="folder of PNG textures")
+    textures.add_argument("output", help="folder for the texture JSONs")
+    textures.add_argument("--prefix", default="", help="texture name prefix")
+    textures.add_argument("--suffix", default="", help="texture name suffix")
+    textures.add_argument("--workers", type=int, default=None, help="writer threads")
+    textures.set_defaults(handler=run_textures)
+
+    blueprint = commands.add_parser("blueprint", help="create a palette blueprint from texture JSONs")
+    blueprint.add_argument("color_textures", help="folder of color texture JSONs")
+    blueprint.add_argument("output", help="blueprint folder to create")
+    blueprint.add_argument("--shape-textures", help="folder of shape texture JSONs, placed after the color textures")
+    blueprint.add_argument("--force", action="store_true", help="overwrite an existing blueprint")
+    blueprint.set_defaults(handler=run_blueprint)
+
+    rotate = commands.add_parser("rotate", help="rotate every image in a folder into its 'rotated' subfolder")
+    rotate.add_argument("folder", help="folder of images")
+    rotate.add_argument("--angle", type=float, default=-90, help="counter-clockwise degrees")
+    rotate.add_argument("--workers", type=int, default=None, help="worker processes")
+    rotate.add_argument("--force", action="store_true", help="rotate images even if their output is up to date")
+    rotate.set_defaults(handler=run_rotate)
+
+    build = commands.add_parser("build", help="build a texture pack from a palette image")
+    add_build_arguments(build)
+    build.add_argument("--incremental", action="store_true", help="update an existing pack, only touching colors that changed")
+    build.add_argument("--experimental-atlas", action="store_true", help="EXPERIMENTAL: put every color in one atlas texture; the game may ignore the region each color JSON points at")
+    build.set_defaults(handler=run_build)
+
+    watch = commands.add_parser("watch", help="rebuild a texture pack incrementally whenever its palette changes, importing the heavy modules only once")
+    add_build_arguments(watch)
+    watch.add_argument("--also", nargs="*", default=[], metavar="PATH", help="more files or folders whose changes trigger a rebuild")
+    watch.add_argument("--interval", type=float, default=1.0, help="seconds between checks for changes")
+    watch.set_defaults(handler=run_watch)
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrumentation.set_output_mode(args.output_mode)
+    with instrumentation.capture(args.profile, args.trace_memory):
+        args.handler(args)
+    if args.report != "none":
+        instrumentation.report(args.report)
+    else:
+        instrumentation.finish_progress()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,23 @@
 import os
+import json
+import time
+import hashlib
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
+import instrumentation
 
-def rotate_images_in_folder(folder_path, rotation_angle=-90):
+MANIFEST_NAME = ".rotation_manifest.json"
+
+# PIL rotates counter-clockwise, so -90 (clockwise) is the same as a 270 transpose
+LOSSLESS_ROTATIONS = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+def rotate_images_in_folder(folder_path, rotation_angle=-90, writer=None):
+    """Rotate every image in a folder into its "rotated" subfolder, queuing the saves on writer if given."""
     if not os.path.exists(folder_path):
         print("Folder does not exist.")
         return
@@ -15,12 +31,121 @@ def rotate_images_in_folder(folder_path, rotation_angle=-90):
             try:
                 with Image.open(file_path) as img:
                     rotated_img = img.rotate(rotation_angle, expand=True)
-                    rotated_img.save(os.path.join(output_folder, filename))
-                    print(f"Rotated: {filename}")
+                    if writer is not None:
+                        writer.save_image(os.path.join(output_folder, filename), rotated_img, img.format)
+                    else:
+                        rotated_img.save(os.path.join(output_folder, filename))
+                        instrumentation.count("files written")
+                    instrumentation.log_item(f"Rotated: {filename}")
             except Exception as e:
                 print(f"Failed to process {filename}: {e}")
 
     print("Rotation complete. Rotated images are saved in the 'rotated' folder.")
 
-# Example usage
-rotate_images_in_folder("C:\Program Files (x86)\Steam\steamapps\common\Spaceflight Simulator\Spaceflight Simulator Game\Mods\Custom Assets\Texture Packs\A-10 Thunderbolt II Shark\Textures")
+def rotate_image(img, rotation_angle):
+    """Rotate an image, using a lossless transpose for multiples of 90 degrees."""
+    angle = rotation_angle % 360
+    if angle == 0:
+        return img.copy()
+    if angle in LOSSLESS_ROTATIONS:
+        return img.transpose(LOSSLESS_ROTATIONS[angle])
+    return img.rotate(rotation_angle, expand=True)
+
+def hash_bytes(data):
+    """Return the content hash recorded for a source image."""
+    return hashlib.sha256(data).hexdigest()
+
+def load_manifest(output_folder):
+    """Load the hashes and angles recorded by the previous batch run."""
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_folder, manifest):
+    """Record the source hash and angle of every rotated image."""
+    with open(os.path.join(output_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+def is_up_to_date(file_path, output_path, entry, rotation_angle):
+    """Check whether the rotated output of a file can be reused."""
+    if not os.path.exists(output_path):
+        return False
+    if entry is not None and entry.get("angle") != rotation_angle:
+        return False
+    if os.path.getmtime(output_path) >= os.path.getmtime(file_path):
+        return True
+    if entry is None:
+        return False
+    with open(file_path, 'rb') as f:
+        return hash_bytes(f.read()) == entry.get("hash")
+
+def rotate_file(file_path, output_path, rotation_angle):
+    """Decode, rotate and encode one file. Runs inside a worker process."""
+    start = time.perf_counter()
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with Image.open(BytesIO(data)) as img:
+            rotated_img = rotate_image(img, rotation_angle)
+            rotated_img.save(output_path)
+        return hash_bytes(data), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+def rotate_images_in_folder_batch(folder_path, rotation_angle=-90, workers=None, force=False):
+    """Rotate every image in a folder across a process pool, skipping up-to-date outputs."""
+    if not os.path.exists(folder_path):
+        print("Folder does not exist.")
+        return
+
+    output_folder = os.path.join(folder_path, "rotated")
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest(output_folder)
+
+    start = time.perf_counter()
+    jobs = []
+    skipped = 0
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            output_path = os.path.join(output_folder, entry.name)
+            if not force and is_up_to_date(entry.path, output_path, manifest.get(entry.name), rotation_angle):
+                skipped += 1
+                continue
+            jobs.append((entry.name, entry.path, output_path))
+
+    instrumentation.count("rotations skipped (up to date)", skipped)
+    rotated = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (filename, executor.submit(rotate_file, file_path, output_path, rotation_angle))
+            for filename, file_path, output_path in jobs
+        ]
+        for i, (filename, future) in enumerate(futures):
+            content_hash, elapsed, error = future.result()
+            if error is not None:
+                print(f"Failed to process {filename}: {error}")
+                manifest.pop(filename, None)
+                continue
+            manifest[filename] = {"hash": content_hash, "angle": rotation_angle}
+            rotated += 1
+            instrumentation.count("files written")
+            instrumentation.log_item(f"Rotated: {filename} ({elapsed * 1000:.1f} ms)", i, len(futures), "Rotating")
+
+    save_manifest(output_folder, manifest)
+    instrumentation.finish_progress()
+
+    total = time.perf_counter() - start
+    throughput = rotated / total if total > 0 else 0
+    print(f"Rotated {rotated} images, skipped {skipped} up-to-date, in {total:.2f}s ({throughput:.1f} images/s).")
+    print("Rotation complete. Rotated images are saved in the 'rotated' folder.")
+
+if __name__ == "__main__":
+    # Example usage
+    rotate_images_in_folder("C:\Program Files (x86)\Steam\steamapps\common\Spaceflight Simulator\Spaceflight Simulator Game\Mods\Custom Assets\Texture Packs\A-10 Thunderbolt II Shark\Textures")
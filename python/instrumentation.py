@@ -0,0 +1,137 @@
+import sys
+import json
+import time
+import pstats
+import threading
+import cProfile
+import tracemalloc
+from io import StringIO
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Shared timers and counters for the pack build scripts, plus the per-item output mode.
+# "verbose" prints every item like the scripts always have, "progress" draws a single
+# progress line instead and "quiet" prints nothing per item.
+# Timers and counters may be updated from writer threads, so every update holds the lock.
+OUTPUT_MODES = ("verbose", "progress", "quiet")
+
+timers = defaultdict(float)
+timer_calls = defaultdict(int)
+counters = defaultdict(int)
+lock = threading.Lock()
+output_mode = "verbose"
+progress_label = None
+progress_filled = None
+
+def set_output_mode(mode):
+    """Choose how per-item messages are shown: "verbose", "progress" or "quiet"."""
+    global output_mode
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{mode}', expected one of {list(OUTPUT_MODES)}")
+    output_mode = mode
+
+def reset():
+    """Clear all timers and counters."""
+    with lock:
+        timers.clear()
+        timer_calls.clear()
+        counters.clear()
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the enclosed block to the named timer."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with lock:
+            timers[name] += elapsed
+            timer_calls[name] += 1
+
+def count(name, amount=1):
+    """Add to a named counter."""
+    with lock:
+        counters[name] += amount
+
+def log_item(message, index=None, total=None, label="Progress"):
+    """Report one processed item according to the output mode."""
+    global progress_label, progress_filled
+    if output_mode == "verbose":
+        print(message)
+    elif output_mode == "progress" and index is not None and total:
+        done = index + 1
+        width = 30
+        filled = width * done // total
+        # Only redraw when the bar visibly moves, so the bar itself stays cheap for huge batches
+        if label != progress_label or filled != progress_filled or done == total:
+            sys.stdout.write(f"\r{label}: [{'#' * filled}{'.' * (width - filled)}] {done}/{total}")
+            progress_label = label
+            progress_filled = filled
+        if done == total:
+            finish_progress()
+
+def finish_progress():
+    """End an unfinished progress line so later output starts on a new line."""
+    global progress_label, progress_filled
+    if progress_label is not None:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        progress_label = None
+        progress_filled = None
+
+def snapshot():
+    """Return the current timers and counters as plain data, e.g. to send back from a worker."""
+    with lock:
+        return {
+            "timers": {name: {"seconds": seconds, "calls": timer_calls[name]} for name, seconds in timers.items()},
+            "counters": dict(counters),
+        }
+
+def merge(data):
+    """Add a snapshot taken elsewhere (e.g. in a worker process) into the current totals."""
+    with lock:
+        for name, timing in data["timers"].items():
+            timers[name] += timing["seconds"]
+            timer_calls[name] += timing["calls"]
+        for name, value in data["counters"].items():
+            counters[name] += value
+
+def report(report_format="table"):
+    """Print all timers and counters as an aligned table or as JSON."""
+    finish_progress()
+    if report_format == "json":
+        print(json.dumps(snapshot(), indent=4))
+        return
+
+    print("\nTimings:")
+    width = max([len(name) for name in list(timers) + list(counters)] + [10])
+    for name, seconds in sorted(timers.items(), key=lambda item: -item[1]):
+        print(f"  {name:<{width}}  {seconds:10.3f}s  ({timer_calls[name]} calls)")
+    print("Counters:")
+    for name, value in sorted(counters.items()):
+        print(f"  {name:<{width}}  {value:>11}")
+
+@contextmanager
+def capture(profile=False, trace_memory=False, top=25):
+    """Optionally run the enclosed block under cProfile and/or tracemalloc and print what they found."""
+    profiler = cProfile.Profile() if profile else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            output = StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(top)
+            print(output.getvalue())
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            top_allocations = tracemalloc.take_snapshot().statistics("lineno")[:top]
+            tracemalloc.stop()
+            print(f"Memory: {current / 1024 / 1024:.1f} MiB still allocated, {peak / 1024 / 1024:.1f} MiB peak")
+            for statistic in top_allocations:
+                print(f"  {statistic}")
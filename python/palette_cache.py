@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import bulk_writer
+
+# Size-bounded, least-recently-used cache of palette extraction results, keyed on the
+# palette image bytes plus every parameter that affects which colors come out.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "palettemaker")
+DEFAULT_MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Decoded RGBA pixels of palettes scanned in tiles, kept as .npy files so later scans memory-map
+# them instead of decoding the image again. They are far bigger than results, so get their own limit.
+PIXELS_SUFFIX = ".pixels.npy"
+DEFAULT_MAX_PIXEL_CACHE_BYTES = 16 * 1024 * 1024 * 1024
+
+def normalize_parameters(avg_difference_threshold, max_colors, min_pixel_percentage, ignore_colors, scan_mode, reduction_mode="greedy", color_space="rgba"):
+    """Return the extraction parameters in a canonical, JSON-serializable form."""
+    return {
+        "avg_difference_threshold": float(avg_difference_threshold),
+        "max_colors": "inf" if max_colors == float("inf") else int(max_colors),
+        "min_pixel_percentage": float(min_pixel_percentage),
+        # The ignore list is a set as far as the result is concerned
+        "ignore_colors": sorted(list(color) for color in set(map(tuple, ignore_colors or []))),
+        "scan_mode": scan_mode,
+        "reduction_mode": reduction_mode,
+        # Greedy reduction always works in RGBA
+        "color_space": color_space if reduction_mode != "greedy" else "rgba",
+    }
+
+def get_cache_key(image_bytes, parameters):
+    """Hash the palette image bytes together with normalized parameters."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def get_pixels_path(cache_dir, image_bytes):
+    """Return where the decoded pixels of a palette image are cached."""
+    return os.path.join(cache_dir, hashlib.sha256(image_bytes).hexdigest() + PIXELS_SUFFIX)
+
+def load(cache_dir, key):
+    """Return the cached (colors, percentages) for a key, or None on a miss."""
+    entry_path = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(entry_path) as f:
+            entry = json.load(f)
+        # Mark the entry as recently used; another process may have evicted it since it was read
+        os.utime(entry_path)
+    except (OSError, ValueError):
+        return None
+    return [tuple(color) for color in entry["colors"]], entry["percentages"]
+
+def store(cache_dir, key, colors, percentages, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """Cache an extraction result, then evict least recently used entries over the size limit."""
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_path = os.path.join(cache_dir, key + ".json")
+    entry = {"colors": [list(color) for color in colors], "percentages": percentages}
+    bulk_writer.write_file_atomic(entry_path, lambda f: json.dump(entry, f))
+    evict(cache_dir, max_cache_bytes)
+
+def evict(cache_dir, max_cache_bytes, suffix=".json", keep=None):
+    """Delete the least recently used entries ending in suffix, other than keep, until they fit in max_cache_bytes."""
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            if entry.name.endswith(suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_cache_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
@@ -0,0 +1,180 @@
+import numpy as np
+
+# Alpha counts double in color_difference; in Lab it is scaled onto L's 0-100 range first
+ALPHA_WEIGHT = 2
+LAB_ALPHA_SCALE = ALPHA_WEIGHT * 100 / 255
+
+def rgba_to_lab(channels):
+    """Convert an (n, 4) uint8 RGBA array to (n, 4) CIELAB (D65) plus weighted alpha."""
+    rgb = channels[:, :3].astype(np.float64) / 255
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041],
+    ])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+
+    lab = np.empty((len(channels), 4))
+    lab[:, 0] = 116 * f[:, 1] - 16
+    lab[:, 1] = 500 * (f[:, 0] - f[:, 1])
+    lab[:, 2] = 200 * (f[:, 1] - f[:, 2])
+    lab[:, 3] = channels[:, 3] * LAB_ALPHA_SCALE
+    return lab
+
+def to_working_space(channels, color_space):
+    """Return colors as float points in the space distances are measured in."""
+    if color_space == "lab":
+        return rgba_to_lab(channels)
+    if color_space == "rgba":
+        points = channels.astype(np.float64)
+        points[:, 3] *= ALPHA_WEIGHT
+        return points
+    raise ValueError(f"Unknown color space '{color_space}', expected 'rgba' or 'lab'")
+
+def get_split(bins, weights):
+    """Find the axis-aligned cut of a box that most reduces its weighted variance.
+
+    bins holds the box's points bucketed into unit-wide integer bins, one row per axis, so
+    every candidate cut is scored from per-bin histograms in linear time. Returns
+    (gain, axis, threshold bin); a box that can't be split has a gain of 0.
+    """
+    best = (0.0, 0, None)
+    for axis, values in enumerate(bins):
+        low = values.min()
+        if values.max() == low:
+            continue
+        histogram = np.bincount(values - low, weights=weights)
+        positions = np.arange(len(histogram))
+        left_weight = np.cumsum(histogram)[:-1]
+        left_moment = np.cumsum(histogram * positions)[:-1]
+        total_weight = left_weight[-1] + histogram[-1]
+        total_moment = left_moment[-1] + histogram[-1] * positions[-1]
+        right_weight = total_weight - left_weight
+
+        # Between-class variance of cutting after each bin, which is the drop in total variance
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gain = (left_moment * total_weight - left_weight * total_moment) ** 2 / (left_weight * right_weight * total_weight)
+        gain[(left_weight == 0) | (right_weight == 0)] = 0
+        split = int(np.argmax(gain))
+        if gain[split] > best[0]:
+            best = (float(gain[split]), axis, low + split)
+    return best
+
+def median_cut(points, weights, target_count):
+    """Split the weighted points into at most target_count boxes, returning a cluster label per point.
+
+    Like classic median cut the space is cut recursively along one axis, but each cut is placed
+    (and the next box chosen) by the largest drop in weighted variance rather than at the median.
+    """
+    # Points are kept reordered so that every box is a contiguous slice, like a k-d tree build
+    bins = np.ascontiguousarray(np.floor(points).astype(np.int32).T)
+    weights = weights.copy()
+    order = np.arange(len(points))
+    boxes = [(0, len(points))]
+    splits = [get_split(bins, weights)]
+
+    while len(boxes) < target_count:
+        best = max(range(len(boxes)), key=lambda i: splits[i][0])
+        gain, axis, threshold = splits[best]
+        if gain == 0:
+            break
+        start, end = boxes[best]
+        left = bins[axis, start:end] <= threshold
+        # One permutation applied with take is much cheaper than boolean-masking every array
+        permutation = np.concatenate((np.flatnonzero(left), np.flatnonzero(~left)))
+        middle = start + int(np.count_nonzero(left))
+        for values in (*bins, weights, order):
+            values[start:end] = values[start:end].take(permutation)
+
+        boxes[best] = (start, middle)
+        splits[best] = get_split(bins[:, start:middle], weights[start:middle])
+        boxes.append((middle, end))
+        splits.append(get_split(bins[:, middle:end], weights[middle:end]))
+
+    labels = np.empty(len(points), dtype=np.int64)
+    for label, (start, end) in enumerate(boxes):
+        labels[order[start:end]] = label
+    return labels
+
+def weighted_centroids(points, weights, labels, cluster_count):
+    """Return the weighted mean point and total weight of every cluster."""
+    totals = np.bincount(labels, weights=weights, minlength=cluster_count)
+    sums = np.stack([np.bincount(labels, weights=weights * points[:, i], minlength=cluster_count) for i in range(points.shape[1])], axis=1)
+    return sums / np.maximum(totals, 1e-12)[:, None], totals
+
+def assign_clusters(points, centroids, chunk_size=65536):
+    """Label every point with its nearest centroid, a chunk of points at a time."""
+    labels = np.empty(len(points), dtype=np.int64)
+    # Single precision is plenty to pick the nearest centroid and halves the memory traffic
+    centroids = centroids.astype(np.float32)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size].astype(np.float32)
+        # |x - c|^2 without the |x|^2 term, which doesn't change the nearest centroid
+        distances = centroid_norms[None, :] - 2 * chunk @ centroids.T
+        labels[start:start + chunk_size] = distances.argmin(axis=1)
+    return labels
+
+def mini_batch_kmeans(points, weights, target_count, iterations=100, batch_size=4096, seed=0):
+    """Refine median-cut clusters with weighted mini-batch k-means, returning a cluster label per point."""
+    labels = median_cut(points, weights, target_count)
+    cluster_count = int(labels.max()) + 1
+    centroids, _ = weighted_centroids(points, weights, labels, cluster_count)
+    # Samples seen by each center; starting from the cluster's pixel mass instead would freeze the centers
+    counts = np.zeros(cluster_count)
+
+    rng = np.random.default_rng(seed)
+    cumulative = np.cumsum(weights)
+    for _ in range(iterations):
+        # Draw a batch with probability proportional to pixel counts
+        sample = np.searchsorted(cumulative, rng.random(batch_size) * cumulative[-1], side="right")
+        batch = points[np.minimum(sample, len(points) - 1)]
+        batch_labels = assign_clusters(batch, centroids)
+        batch_counts = np.bincount(batch_labels, minlength=cluster_count)
+        batch_sums = np.stack([np.bincount(batch_labels, weights=batch[:, i], minlength=cluster_count) for i in range(points.shape[1])], axis=1)
+
+        seen = batch_counts > 0
+        counts[seen] += batch_counts[seen]
+        # A 1 / seen-count learning rate per sample keeps each center the running mean of its samples
+        centroids[seen] += (batch_sums[seen] - batch_counts[seen][:, None] * centroids[seen]) / counts[seen][:, None]
+
+    return assign_clusters(points, centroids)
+
+CLUSTERING_METHODS = {
+    "median_cut": median_cut,
+    "kmeans": mini_batch_kmeans,
+}
+
+COLOR_SPACES = ("rgba", "lab")
+
+def check_options(method, color_space):
+    """Raise ValueError for an unknown clustering method or color space. A method of None is not checked."""
+    if method is not None and method not in CLUSTERING_METHODS:
+        raise ValueError(f"Unknown clustering method '{method}', expected one of {list(CLUSTERING_METHODS)}")
+    if color_space not in COLOR_SPACES:
+        raise ValueError(f"Unknown color space '{color_space}', expected one of {list(COLOR_SPACES)}")
+
+def cluster_colors(channels, counts, target_count, method="median_cut", color_space="rgba"):
+    """Merge a weighted color histogram into at most target_count colors.
+
+    Clusters are formed in the chosen color space; each resulting color is the pixel-weighted
+    RGBA mean of its members. Returns (colors, percentages) sorted by descending percentage.
+    """
+    check_options(method, color_space)
+
+    weights = counts.astype(np.float64)
+    labels = CLUSTERING_METHODS[method](to_working_space(channels, color_space), weights, target_count)
+    cluster_count = int(labels.max()) + 1
+    means, totals = weighted_centroids(channels.astype(np.float64), weights, labels, cluster_count)
+
+    merged = {}
+    for mean, total in zip(np.clip(np.rint(means), 0, 255).astype(int).tolist(), totals.tolist()):
+        if total > 0:
+            color = tuple(mean)
+            merged[color] = merged.get(color, 0) + total
+
+    grand_total = float(weights.sum())
+    ordered = sorted(merged.items(), key=lambda item: -item[1])
+    return [color for color, _ in ordered], [total / grand_total * 100 for _, total in ordered]
@@ -1,5 +1,10 @@
 import os
+import re
+import copy
 import json
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+import bulk_writer
 
 brick = '{      "n": "Fuel Tank",      "p": {        "x": 10.0,        "y": 0.5      },      "o": {        "x": 1.0,        "y": 1.0,        "z": 0.0      },      "t": "-Infinity",      "N": {        "width_original": 2.0,        "width_a": 2.0,        "width_b": 2.0,        "height": 2.0,        "fuel_percent": 1.0      },      "T": {        "color_tex": "_",        "shape_tex": "Flat"      }    }'
 bp_template = '{  "center": 10.0,  "parts": [      ],  "stages": [],  "rotation": 0.0,  "offset": {    "x": 0.0,    "y": 0.0  },  "interiorView": false}'
@@ -7,21 +12,85 @@ bp_template = '{  "center": 10.0,  "parts": [      ],  "stages": [],  "rotation"
 game_path = "C:\\Program Files (x86)\\Steam\\steamapps\\common\\Spaceflight Simulator\\Spaceflight Simulator Game"
 textures_path = os.path.join(game_path, "Mods", "Custom Assets", "Texture Packs")
 
-def get_all_texture_names(path):
+# Parsed once; every part is a copy of this
+brick_part = json.loads(brick)
+
+# Stand-ins rendered into the blueprint and brick text, then swapped for each part's values
+PARTS_PLACEHOLDER = "\0parts\0"
+COLOR_TEX_PLACEHOLDER = "\0color_tex\0"
+SHAPE_TEX_PLACEHOLDER = "\0shape_tex\0"
+X_PLACEHOLDER = "\0x\0"
+
+# Sidecar cache of texture names, keyed by relative path and validated by mtime and size.
+# The extension keeps it out of the .json/.txt files being indexed.
+TEXTURE_INDEX_NAME = ".texture_names.cache"
+
+def read_texture_entry(file_path, stat):
+    """Parse one texture file into an index entry holding its name, if it has one."""
+    with open(file_path) as f:
+        decoded = json.load(f)
+    entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+    try:
+        entry["name"] = decoded['name']
+    except KeyError:
+        pass
+    return entry
+
+def load_texture_index(index_path):
+    """Load a texture name index, treating a missing or unreadable one as empty."""
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_texture_index(index_path, index):
+    """Write a texture name index next to the files it describes."""
+    with open(index_path, 'w') as f:
+        json.dump(index, f)
+
+def get_all_texture_names(path, use_index=True, workers=None):
     """Retrieve all unique texture names from JSON or text files in a directory."""
-    textures = []
-    file_names = []
+    index_path = os.path.join(path, TEXTURE_INDEX_NAME)
+    old_index = load_texture_index(index_path) if use_index else {}
+    index = {}
+
+    found = []
+    stale = []
     for root, dirs, files in os.walk(path):
         for file in files:
             if file.endswith(".json") or file.endswith(".txt"):
-                with open(os.path.join(root, file)) as f:
-                    decoded = json.load(f)
-                try:
-                    if decoded['name'] not in textures:
-                        textures.append(decoded['name'])
-                        file_names.append(file)
-                except KeyError:
-                    pass
+                file_path = os.path.join(root, file)
+                key = os.path.relpath(file_path, path)
+                stat = os.stat(file_path)
+                entry = old_index.get(key)
+                if entry is not None and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                    index[key] = entry
+                else:
+                    stale.append((key, file_path, stat))
+                found.append((key, file))
+
+    instrumentation.count("texture index hits", len(found) - len(stale))
+    instrumentation.count("files read", len(stale))
+    # Only new or changed files are parsed
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = executor.map(lambda item: read_texture_entry(item[1], item[2]), stale)
+            for (key, _, _), entry in zip(stale, entries):
+                index[key] = entry
+
+    if use_index and found and index != old_index:
+        save_texture_index(index_path, index)
+
+    textures = []
+    file_names = []
+    seen = set()
+    for key, file in found:
+        entry = index[key]
+        if "name" in entry and entry["name"] not in seen:
+            seen.add(entry["name"])
+            textures.append(entry["name"])
+            file_names.append(file)
 
     # sort textures by file name
     textures = [x for _, x in sorted(zip(file_names, textures))]
@@ -29,19 +98,102 @@ def get_all_texture_names(path):
 
 
 
+def make_brick(color_tex, shape_tex, x):
+    """Return a new brick part with the given textures at the given x position."""
+    brick_json = copy.deepcopy(brick_part)
+    brick_json['T']['color_tex'] = color_tex
+    brick_json['T']['shape_tex'] = shape_tex
+    brick_json['p']['x'] = x
+    return brick_json
+
 def create_palette_blueprint(input_texture_path):
     """Create a blueprint from the textures of a specified texture pack."""
     textures = get_all_texture_names(input_texture_path)
-    bp = json.loads(bp_template)
-    
-    for i, texture in enumerate(textures):
-        brick_json = json.loads(brick)
-        brick_json['T']['color_tex'] = texture
-        brick_json['p']['x'] = i * 2
-        bp['parts'].append(brick_json)
+    return create_blueprint_from_texture_names(textures)
 
+def create_blueprint_from_texture_names(textures):
+    """Create a blueprint with one part per color texture name, in the given order."""
+    bp = json.loads(bp_template)
+    bp['parts'] = [make_brick(*record) for record in iter_palette_parts(textures)]
     return bp
 
+def iter_palette_parts(color_textures, shape_textures=()):
+    """Yield (color_tex, shape_tex, x) records: color textures first, then shape textures after the last of them."""
+    x = -2
+    for texture in color_textures:
+        x += 2
+        yield texture, "Flat", x
+    for texture in shape_textures:
+        x += 2
+        yield "_", texture, x
+
+def compile_blueprint_template():
+    """Render the blueprint and brick templates once, returning the blueprint text around the parts and a part renderer."""
+    bp = json.loads(bp_template)
+    empty = json.dumps(bp, indent=4)
+    bp['parts'] = [PARTS_PLACEHOLDER]
+    head, tail = json.dumps(bp, indent=4).split(json.dumps(PARTS_PLACEHOLDER))
+
+    # Parts sit two levels deep, so every line after the first is indented by 8 more spaces
+    rendered = json.dumps(make_brick(COLOR_TEX_PLACEHOLDER, SHAPE_TEX_PLACEHOLDER, X_PLACEHOLDER), indent=4)
+    rendered = rendered.replace("\n", "\n        ")
+    slots = [json.dumps(placeholder) for placeholder in (COLOR_TEX_PLACEHOLDER, SHAPE_TEX_PLACEHOLDER, X_PLACEHOLDER)]
+    pieces = re.split("(" + "|".join(re.escape(slot) for slot in slots) + ")", rendered)
+
+    def render(color_tex, shape_tex, x):
+        values = dict(zip(slots, (json.dumps(color_tex), json.dumps(shape_tex), json.dumps(x))))
+        return "".join(values.get(piece, piece) for piece in pieces)
+
+    return empty, head, tail, render
+
+def iter_blueprint_text(parts):
+    """Yield Blueprint.txt a part at a time from (color_tex, shape_tex, x) records, matching json.dumps(indent=4)."""
+    empty, head, tail, render = compile_blueprint_template()
+    parts = iter(parts)
+    first = next(parts, None)
+    if first is None:
+        yield empty
+        return
+
+    yield head
+    yield render(*first)
+    for record in parts:
+        yield ",\n        "
+        yield render(*record)
+    yield tail
+
+def write_blueprint(bp_path, parts, writer=None):
+    """Stream a blueprint with the given part records to a file without building it in memory."""
+    if writer is not None:
+        writer.write_chunks(bp_path, iter_blueprint_text(parts))
+        return
+    with open(bp_path, 'w') as f:
+        for chunk in iter_blueprint_text(parts):
+            f.write(chunk)
+        instrumentation.count("bytes written", f.tell())
+    instrumentation.count("files written")
+
+def patch_blueprint(bp_path, added_textures, removed_textures, writer=None):
+    """Remove the parts of removed color textures and add parts for new ones after the farthest part, leaving the rest as they are."""
+    with open(bp_path) as f:
+        bp = json.load(f)
+
+    removed = set(removed_textures)
+    bp['parts'] = [part for part in bp['parts'] if part['T']['color_tex'] not in removed]
+    x = max((part['p']['x'] for part in bp['parts']), default=-2)
+    for texture in added_textures:
+        x += 2
+        bp['parts'].append(make_brick(texture, "Flat", x))
+
+    text = json.dumps(bp, indent=4)
+    if writer is not None:
+        writer.write_text(bp_path, text)
+        return
+    with open(bp_path, 'w') as f:
+        f.write(text)
+        instrumentation.count("bytes written", f.tell())
+    instrumentation.count("files written")
+
 def main():
     """Main function for creating a blueprint from a texture pack."""
     # Inputs
@@ -59,19 +211,11 @@ def main():
 
     input_texture_path = os.path.join(textures_path, texture_pack_name, "Color Textures")
     second_input_texture_path = os.path.join(textures_path, texture_pack_name, "Shape Textures")
-    blueprint = create_palette_blueprint(input_texture_path)
-
-    farthest_part = blueprint['parts'][-1]
-
+    color_textures_names = get_all_texture_names(input_texture_path)
 
     # merge shadow textures with the color textures blueprint
     shape_textures_names = get_all_texture_names(second_input_texture_path)
-    for i, texture in enumerate(shape_textures_names):
-        brick_json = json.loads(brick)
-        brick_json['T']['color_tex'] = "_"
-        brick_json['T']['shape_tex'] = texture
-        brick_json['p']['x'] = farthest_part['p']['x'] + 2 * (i + 1)
-        blueprint['parts'].append(brick_json)
+    parts = iter_palette_parts(color_textures_names, shape_textures_names)
 
     folder_path = os.path.join(output_blueprint_path, blueprint_name)
     bp_path = os.path.join(folder_path, "Blueprint.txt")
@@ -82,12 +226,9 @@ def main():
         if override == False:
             raise FileExistsError(f"Blueprint with this name ({blueprint_name}) already exists, not overwriting, at the path {folder_path}")
 
-    with open(bp_path, 'w') as f:
-        f.write(json.dumps(blueprint, indent=4))
-
-    version_path = os.path.join(folder_path, "Version.txt")
-    with open(version_path, 'w') as f:
-        f.write('"1.5.10.2"')
+    with bulk_writer.BulkWriter() as writer:
+        write_blueprint(bp_path, parts, writer)
+        writer.write_text(os.path.join(folder_path, "Version.txt"), '"1.5.10.2"')
 
     print(f"Blueprint created successfully at {bp_path}")
 
@@ -1,7 +1,18 @@
 from PIL import Image
+import numpy as np
 import os
+import mmap
+import json
+import warnings
+from io import BytesIO
 import math
-from collections import Counter, defaultdict
+import itertools
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+import palette_cache
+import palette_clustering
+import instrumentation
+import bulk_writer
 
 def color_difference(color1, color2):
     """Calculate the Euclidean distance between two RGBA colors."""
@@ -21,49 +32,226 @@ def calculate_color_similarities(colors):
         similarities[color1] = total_difference / (len(colors) - 1) if len(colors) > 1 else float('inf')
     return similarities
 
+def get_weighted_color_array(colors):
+    """Return colors as a float array in the alpha-weighted space used by color_difference."""
+    values = np.array(colors, dtype=np.float64).reshape(-1, 4)
+    values[:, 3] *= 2
+    return values
+
+def color_differences_from(values, index):
+    """Return the color_difference of one row of a weighted color array to every row."""
+    return np.sqrt(((values - values[index]) ** 2).sum(axis=1))
+
+def get_color_difference_sums(values, block_size=256):
+    """Sum each color's differences to all others, one block of rows at a time."""
+    sums = np.empty(len(values))
+    for start in range(0, len(values), block_size):
+        block = values[start:start + block_size]
+        differences = np.sqrt(((block[:, None, :] - values[None, :, :]) ** 2).sum(axis=2))
+        sums[start:start + block_size] = differences.sum(axis=1)
+    return sums
+
 def reduce_colors(colors, percentages, target_count):
     """Reduce colors to target count by removing most similar colors."""
-    while len(colors) > target_count:
-        similarities = calculate_color_similarities(colors)
-        most_similar_color = min(similarities.items(), key=lambda x: x[1])[0]
+    if len(colors) <= target_count:
+        return colors
+
+    # Running difference sums are updated in O(n) per removal instead of being
+    # recomputed from scratch, which keeps the whole reduction O(n^2).
+    original_colors = list(colors)
+    original_count = len(colors)
+    values = get_weighted_color_array(colors)
+    remaining = list(range(len(colors)))
+    alive = np.ones(len(colors), dtype=bool)
+    sums = get_color_difference_sums(values)
+    # Running sums drift slightly from the sequential sums calculate_color_similarities
+    # produces, so every color within this margin of the minimum is re-checked exactly.
+    tolerance = 1e-9 * max(1.0, float(sums.max()))
+
+    while len(remaining) > target_count:
+        if len(remaining) == 1:
+            most_similar_index = remaining[0]
+        else:
+            candidate_sums = np.where(alive, sums, np.inf)
+            candidates = np.flatnonzero(candidate_sums <= candidate_sums.min() + tolerance)
+            most_similar_index = None
+            best_similarity = math.inf
+            for index in candidates:
+                # cumsum adds sequentially, exactly like the original inner loop
+                differences = color_differences_from(values, index)[remaining]
+                similarity = np.cumsum(differences)[-1] / (len(remaining) - 1)
+                if most_similar_index is None or similarity < best_similarity:
+                    most_similar_index = index
+                    best_similarity = similarity
+
+        most_similar_color = original_colors[most_similar_index]
         removed_percentage = percentages[most_similar_color]
-        print(f"Removed color RGBA{most_similar_color} ({removed_percentage:.2f}% of non-ignored pixels)")
+        instrumentation.log_item(
+            f"Removed color RGBA{most_similar_color} ({removed_percentage:.2f}% of non-ignored pixels)",
+            original_count - len(remaining), original_count - target_count, "Reducing colors"
+        )
+        instrumentation.count("colors removed")
         colors.remove(most_similar_color)
         del percentages[most_similar_color]
+
+        remaining.remove(most_similar_index)
+        alive[most_similar_index] = False
+        sums -= color_differences_from(values, most_similar_index)
     return colors
 
 def should_ignore_color(color, ignore_list, threshold):
     """Check if a color should be ignored based on the ignore list."""
     return any(color_difference(color, ignored_color) <= threshold for ignored_color in ignore_list)
 
-def get_color_frequencies(image, ignore_colors, avg_difference_threshold, scan_mode):
+def pack_cell_keys(cells):
+    """Pack 4D voxel cell coordinates (each below 1024) into single int64 keys."""
+    cells = np.asarray(cells, dtype=np.int64)
+    return (cells[..., 0] << 30) | (cells[..., 1] << 20) | (cells[..., 2] << 10) | cells[..., 3]
+
+class IgnoreColorIndex:
+    """Voxel grid over the ignore list for fast "within threshold of an ignored color" checks.
+
+    Colors are placed in the alpha-weighted RGBA space used by color_difference, on a grid
+    whose cells are at least as wide as the threshold, so a match can only lie in a color's
+    own cell or one of its 80 neighbours. Distances are compared squared.
+    """
+
+    def __init__(self, ignore_colors, threshold):
+        self.threshold = threshold
+        self.threshold_squared = threshold ** 2
+        self.cell_size = max(float(threshold), 1.0)
+        # Weighted coordinates are integers, so below one unit only exact matches count
+        # and a color's own cell is the only one that needs searching.
+        steps = (-1, 0, 1) if threshold >= 1 else (0,)
+        self.offsets = np.array(list(itertools.product(steps, repeat=4)), dtype=np.int64)
+        self.known = {}
+
+        points = get_weighted_color_array(ignore_colors if ignore_colors else [])
+        cells = self.get_cells(points)
+        keys = pack_cell_keys(cells)
+        # Every cell that has an ignored color in itself or a neighbour
+        self.neighbourhood_keys = np.unique(pack_cell_keys(cells[:, None, :] - self.offsets[None, :, :]))
+        order = np.argsort(keys, kind="stable")
+        self.points = points[order]
+        self.keys, self.starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.ends = self.starts + counts
+        self.max_occupancy = int(counts.max()) if len(counts) else 0
+        self.cells = {
+            key: [tuple(point) for point in self.points[start:end].tolist()]
+            for key, start, end in zip(self.keys.tolist(), self.starts.tolist(), self.ends.tolist())
+        }
+        self.neighbour_steps = [tuple(offset) for offset in self.offsets.tolist()]
+
+    def get_cells(self, values):
+        """Return the (offset by one) voxel cell of each weighted color."""
+        return np.floor(values / self.cell_size).astype(np.int64) + 1
+
+    def contains(self, color):
+        """Check whether a single RGBA color is within threshold of any ignored color."""
+        if color in self.known:
+            return self.known[color]
+
+        r, g, b, a = color
+        point = (r, g, b, 2 * a)
+        cell = [int(value // self.cell_size) + 1 for value in point]
+        result = False
+        if self.threshold >= 0:
+            for dr, dg, db, da in self.neighbour_steps:
+                key = ((cell[0] + dr) << 30) | ((cell[1] + dg) << 20) | ((cell[2] + db) << 10) | (cell[3] + da)
+                for ignored in self.cells.get(key, ()):
+                    if sum((p - q) ** 2 for p, q in zip(point, ignored)) <= self.threshold_squared:
+                        result = True
+                        break
+                if result:
+                    break
+
+        self.known[color] = result
+        return result
+
+    def contains_many(self, colors):
+        """Check a whole (n, 4) array of RGBA colors at once, returning a boolean mask."""
+        values = get_weighted_color_array(colors)
+        result = np.zeros(len(values), dtype=bool)
+        if self.threshold < 0 or not len(self.keys):
+            return result
+
+        cells = self.get_cells(values)
+        # Most colors are nowhere near an ignored one and drop out here in a single pass
+        nearby = np.flatnonzero(np.isin(pack_cell_keys(cells), self.neighbourhood_keys))
+        for offset in self.offsets:
+            pending = nearby[~result[nearby]]
+            if not len(pending):
+                break
+            keys = pack_cell_keys(cells[pending] + offset)
+            positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = self.keys[positions] == keys
+            queries = pending[found]
+            starts = self.starts[positions[found]]
+            ends = self.ends[positions[found]]
+            # Walk the k-th ignored color of every matched cell together
+            for k in range(self.max_occupancy):
+                valid = starts + k < ends
+                if not valid.any():
+                    break
+                query_rows = queries[valid]
+                ignored = self.points[starts[valid] + k]
+                within = ((values[query_rows] - ignored) ** 2).sum(axis=1) <= self.threshold_squared
+                result[query_rows[within]] = True
+        return result
+
+def get_image_size(image):
+    """Return the (width, height) of a PIL image or of a (height, width, 4) RGBA pixel array."""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+def to_rgba(image):
+    """Convert a PIL image to RGBA; pixel arrays already are."""
+    if isinstance(image, np.ndarray) or image.mode == 'RGBA':
+        return image
+    return image.convert('RGBA')
+
+def get_scan_axis(image, scan_mode):
+    """Return "x" (top row), "y" (left column) or None (whole image) for a scan mode."""
+    if scan_mode != "row":
+        return None
+    width, height = get_image_size(image)
+    if height > width:
+        return "y"
+    if width > height:
+        return "x"
+    # Square: ask user
+    orientation = input("Enter 'X' or 'Y': ")
+    return "x" if orientation.upper() == 'X' else "y"
+
+def get_color_frequencies(image, ignore_colors, avg_difference_threshold, scan_mode, ignore_index=None, tile_rows=None, workers=None):
+    """Count non-ignored colors pixel by pixel."""
+    if tile_rows is not None or isinstance(image, np.ndarray):
+        raise ValueError("The pixel frequency engine needs a whole PIL image; use the vectorized engine for tiled or pixel array scans")
     if image.mode != 'RGBA':
         image = image.convert('RGBA')
 
+    if ignore_index is None:
+        ignore_index = IgnoreColorIndex(ignore_colors, avg_difference_threshold)
+
     color_count = Counter()
     total_counted_pixels = 0
 
-    if scan_mode == "row":
-        if image.height > image.width:
-            # Scan top to bottom (x=0, y in range)
-            coordinates = [(0, y) for y in range(image.height)]
-        elif image.width > image.height:
-            # Scan left to right (y=0, x in range)
-            coordinates = [(x, 0) for x in range(image.width)]
-        else:
-            # Square: ask user
-            orientation = input("Enter 'X' or 'Y': ")
-            if orientation.upper() == 'X':
-                coordinates = [(x, 0) for x in range(image.width)]
-            else:
-                coordinates = [(0, y) for y in range(image.height)]
+    scan_axis = get_scan_axis(image, scan_mode)
+    if scan_axis == "y":
+        # Scan top to bottom (x=0, y in range)
+        coordinates = [(0, y) for y in range(image.height)]
+    elif scan_axis == "x":
+        # Scan left to right (y=0, x in range)
+        coordinates = [(x, 0) for x in range(image.width)]
     else:
         # Full image scan
         coordinates = [(x, y) for y in range(image.height) for x in range(image.width)]
 
+    instrumentation.count("pixels scanned", len(coordinates))
     for (x, y) in coordinates:
         pixel = image.getpixel((x, y))
-        if not should_ignore_color(pixel, ignore_colors, avg_difference_threshold):
+        if not ignore_index.contains(pixel):
             color_count[pixel] += 1
             total_counted_pixels += 1
 
@@ -78,16 +266,213 @@ def get_color_frequencies(image, ignore_colors, avg_difference_threshold, scan_m
 
     return color_percentages, total_counted_pixels
 
-def get_unique_colors(image, avg_difference_threshold=0, max_colors=math.inf, min_pixel_percentage=1.0, ignore_colors=None, scan_mode="full"):
+def pack_rgba(image, scan_axis=None):
+    """Return the scanned pixels of an RGBA image as a flat array of packed uint32 colors."""
+    pixels = np.asarray(image, dtype=np.uint8)
+    if scan_axis == "y":
+        pixels = pixels[:, 0, :]
+    elif scan_axis == "x":
+        pixels = pixels[0, :, :]
+    return np.ascontiguousarray(pixels).view("<u4").reshape(-1)
+
+def unpack_rgba(packed):
+    """Convert an array of packed uint32 colors back into a list of RGBA tuples."""
+    channels = np.ascontiguousarray(packed, dtype="<u4").view(np.uint8).reshape(-1, 4)
+    return [tuple(color) for color in channels.tolist()]
+
+def get_color_histogram(packed):
+    """Count packed colors, returning (colors, counts) in order of first appearance."""
+    # Sorting color << 32 | position groups equal colors with their first position leading,
+    # which is much faster than np.unique(return_index=True)'s stable argsort.
+    keys = (packed.astype(np.uint64) << np.uint64(32)) | np.arange(len(packed), dtype=np.uint64)
+    keys.sort()
+    sorted_colors = (keys >> np.uint64(32)).astype(np.uint32)
+    starts = np.flatnonzero(np.concatenate(([True], sorted_colors[1:] != sorted_colors[:-1])))
+    counts = np.diff(np.append(starts, len(keys)))
+    order = np.argsort(keys[starts] & np.uint64(0xFFFFFFFF))
+    return sorted_colors[starts][order], counts[order]
+
+def merge_color_histograms(histograms):
+    """Combine (colors, counts) histograms of consecutive parts of an image, keeping first-appearance order."""
+    if len(histograms) == 1:
+        return histograms[0]
+    colors = np.concatenate([colors for colors, _ in histograms])
+    counts = np.concatenate([counts for _, counts in histograms])
+    if len(colors) == 0:
+        return colors, counts
+
+    # Each part is already in first-appearance order, so the first occurrence in the
+    # concatenation is the first appearance in the image
+    keys = (colors.astype(np.uint64) << np.uint64(32)) | np.arange(len(colors), dtype=np.uint64)
+    keys.sort()
+    positions = (keys & np.uint64(0xFFFFFFFF)).astype(np.intp)
+    sorted_colors = (keys >> np.uint64(32)).astype(np.uint32)
+    starts = np.flatnonzero(np.concatenate(([True], sorted_colors[1:] != sorted_colors[:-1])))
+    merged_counts = np.add.reduceat(counts[positions], starts)
+    order = np.argsort(positions[starts])
+    return sorted_colors[starts][order], merged_counts[order]
+
+def get_pixel_file(image):
+    """Return the .npy file behind a whole memory-mapped RGBA pixel array, or None."""
+    if (
+        isinstance(image, np.memmap)
+        # A slice of a memory map shares its filename and offset but not its rows
+        and isinstance(image.base, mmap.mmap)
+        and image.dtype == np.uint8
+        and image.ndim == 3
+        and image.flags.c_contiguous
+    ):
+        return image.filename
+    return None
+
+def read_pixel_rows(f, offset, width, top, bottom):
+    """Read rows top to bottom of an RGBA pixel file whose pixels start at offset."""
+    # Plain reads instead of the memory map, so pages already scanned don't stay resident
+    f.seek(offset + top * width * 4)
+    return np.frombuffer(f.read((bottom - top) * width * 4), dtype=np.uint8).reshape(bottom - top, width, 4)
+
+def iter_rgba_strips(image, tile_rows, height=None):
+    """Yield consecutive strips of up to tile_rows rows as (rows, width, 4) uint8 arrays."""
+    width, image_height = get_image_size(image)
+    height = image_height if height is None else height
+    pixels_path = get_pixel_file(image)
+    if pixels_path is not None:
+        with open(pixels_path, 'rb') as f:
+            for top in range(0, height, tile_rows):
+                yield read_pixel_rows(f, image.offset, width, top, min(top + tile_rows, height))
+        return
+
+    for top in range(0, height, tile_rows):
+        bottom = min(top + tile_rows, height)
+        if isinstance(image, np.ndarray):
+            yield image[top:bottom]
+        else:
+            # Pillow decodes the whole image on the first crop; only the RGBA conversion is per strip
+            yield np.asarray(to_rgba(image.crop((0, top, width, bottom))), dtype=np.uint8)
+
+def count_pixel_tile(pixels_path, offset, width, top, bottom, scan_axis):
+    """Histogram one strip of a .npy pixel file. Runs inside a worker process."""
+    with open(pixels_path, 'rb') as f:
+        return get_color_histogram(pack_rgba(read_pixel_rows(f, offset, width, top, bottom), scan_axis))
+
+def iter_tile_histograms(image, scan_axis, tile_rows, workers=None):
+    """Yield the histogram of every strip in order, counting up to 2 * workers strips at a time in worker processes."""
+    # The top row is a single strip
+    height = 1 if scan_axis == "x" else get_image_size(image)[1]
+    if workers is None or workers <= 1:
+        for strip in iter_rgba_strips(image, tile_rows, height):
+            yield get_color_histogram(pack_rgba(strip, scan_axis))
+        return
+
+    # Workers read the strips of pixel files themselves instead of being sent the pixels
+    pixels_path = get_pixel_file(image)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        if pixels_path is not None:
+            jobs = (
+                executor.submit(count_pixel_tile, pixels_path, image.offset, image.shape[1], top, min(top + tile_rows, height), scan_axis)
+                for top in range(0, height, tile_rows)
+            )
+        else:
+            jobs = (
+                executor.submit(get_color_histogram, pack_rgba(strip, scan_axis))
+                for strip in iter_rgba_strips(image, tile_rows, height)
+            )
+        for job in jobs:
+            in_flight.append(job)
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def get_tiled_color_histogram(image, scan_axis, tile_rows, workers=None):
+    """Count packed colors strip by strip.
+
+    For .npy pixel files memory follows the strip size rather than the image size. Image files are
+    still decoded whole by Pillow, so only their RGBA conversion and counting are bounded.
+    """
+    width, height = get_image_size(image)
+    instrumentation.count("pixels scanned", width if scan_axis == "x" else height if scan_axis == "y" else width * height)
+
+    merged = []
+    pending = []
+    pending_size = 0
+    for histogram in iter_tile_histograms(image, scan_axis, tile_rows, workers):
+        instrumentation.count("tiles scanned")
+        pending.append(histogram)
+        pending_size += len(histogram[0])
+        # Only re-merge once the new strips outgrow what is merged, so merging stays linear overall
+        if pending_size >= (len(merged[0][0]) if merged else 0):
+            merged = [merge_color_histograms(merged + pending)]
+            pending = []
+            pending_size = 0
+
+    if not merged and not pending:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    return merge_color_histograms(merged + pending)
+
+def get_kept_color_histogram(image, ignore_index, scan_mode, tile_rows=None, workers=None):
+    """Count the packed colors of an RGBA image in first-appearance order, dropping ignored ones.
+
+    With tile_rows set the image is read in strips of that many rows, optionally across worker processes.
+    """
+    scan_axis = get_scan_axis(image, scan_mode)
+    if tile_rows is None:
+        packed = pack_rgba(image, scan_axis)
+        instrumentation.count("pixels scanned", len(packed))
+        colors, counts = get_color_histogram(packed)
+    else:
+        colors, counts = get_tiled_color_histogram(image, scan_axis, tile_rows, workers)
+
+    # The ignore list only needs checking once per distinct color
+    ignored = ignore_index.contains_many(np.ascontiguousarray(colors).view(np.uint8).reshape(-1, 4))
+    return colors[~ignored], counts[~ignored]
+
+def get_color_frequencies_vectorized(image, ignore_colors, avg_difference_threshold, scan_mode, ignore_index=None, tile_rows=None, workers=None):
+    """Count non-ignored colors in bulk, matching get_color_frequencies exactly."""
+    if tile_rows is None:
+        image = to_rgba(image)
+
+    if ignore_index is None:
+        ignore_index = IgnoreColorIndex(ignore_colors, avg_difference_threshold)
+
+    colors, counts = get_kept_color_histogram(image, ignore_index, scan_mode, tile_rows, workers)
+    color_count = dict(zip(unpack_rgba(colors), counts.tolist()))
+    total_counted_pixels = sum(color_count.values())
+
+    if total_counted_pixels == 0:
+        print("Warning: All pixels matched ignore list!")
+        return {}, 0
+
+    color_percentages = {
+        color: (count / total_counted_pixels) * 100
+        for color, count in color_count.items()
+    }
+
+    return color_percentages, total_counted_pixels
+
+FREQUENCY_ENGINES = {
+    "pixel": get_color_frequencies,
+    "vectorized": get_color_frequencies_vectorized,
+}
+
+def check_reduction_options(reduction_mode, color_space):
+    """Reject an unknown reduction mode or color space before the palette is scanned."""
+    # Greedy reduction is done here rather than by palette_clustering
+    palette_clustering.check_options(None if reduction_mode == "greedy" else reduction_mode, color_space)
+
+def get_unique_colors(image, avg_difference_threshold=0, max_colors=math.inf, min_pixel_percentage=1.0, ignore_colors=None, scan_mode="full", frequency_engine="vectorized", reduction_mode="greedy", color_space="rgba", tile_rows=None, tile_workers=None):
     """Extract unique colors from an image with smart reduction to meet maximum color limit."""
-    if image.mode != 'RGBA':
-        image = image.convert('RGBA')
+    colors, _ = get_unique_colors_with_percentages(image, avg_difference_threshold, max_colors, min_pixel_percentage, ignore_colors, scan_mode, frequency_engine, reduction_mode, color_space, tile_rows, tile_workers)
+    return colors
 
-    if ignore_colors is None:
-        ignore_colors = []
+def print_colors(colors, percentages):
+    """Report every kept color with its share of the non-ignored pixels."""
+    for i, (color, percentage) in enumerate(zip(colors, percentages)):
+        instrumentation.log_item(f"Color RGBA{color} ({percentage:.2f}% of non-ignored pixels)", i, len(colors), "Colors")
 
-    color_percentages, total_counted_pixels = get_color_frequencies(image, ignore_colors, avg_difference_threshold, scan_mode)
-    total_pixels = image.width * (1 if scan_mode == "row" else image.height)
+def print_pixel_analysis(total_pixels, total_counted_pixels):
+    """Print how many of the scanned pixels were ignored and considered."""
     ignored_pixels = total_pixels - total_counted_pixels
 
     print(f"\nPixel Analysis:")
@@ -95,6 +480,66 @@ def get_unique_colors(image, avg_difference_threshold=0, max_colors=math.inf, mi
     print(f"- Ignored pixels: {ignored_pixels} ({(ignored_pixels/total_pixels)*100:.1f}% of image)")
     print(f"- Considered pixels: {total_counted_pixels} ({(total_counted_pixels/total_pixels)*100:.1f}% of image)")
 
+def get_clustered_colors_with_percentages(image, ignore_index, max_colors, min_pixel_percentage, scan_mode, reduction_mode, color_space, tile_rows=None, tile_workers=None):
+    """Reduce colors by clustering the pixel-weighted histogram, merging pixel mass instead of dropping it."""
+    with instrumentation.timer("color frequencies"):
+        colors, counts = get_kept_color_histogram(image, ignore_index, scan_mode, tile_rows, tile_workers)
+    total_counted_pixels = int(counts.sum())
+    instrumentation.count("colors considered", len(colors))
+    width, height = get_image_size(image)
+    print_pixel_analysis(width * (1 if scan_mode == "row" else height), total_counted_pixels)
+
+    if total_counted_pixels == 0:
+        print("Warning: All pixels matched ignore list!")
+        return [], []
+
+    channels = np.ascontiguousarray(colors).view(np.uint8).reshape(-1, 4)
+    if len(colors) > max_colors:
+        print(f"\nClustering {len(colors)} colors into {max_colors} colors ({reduction_mode}, {color_space}):")
+        with instrumentation.timer("color reduction"):
+            clustered_colors, clustered_percentages = palette_clustering.cluster_colors(channels, counts, max_colors, reduction_mode, color_space)
+        instrumentation.count("colors removed", len(colors) - len(clustered_colors))
+    else:
+        clustered_colors = unpack_rgba(colors)
+        clustered_percentages = [(count / total_counted_pixels) * 100 for count in counts.tolist()]
+
+    kept = [
+        (color, percentage)
+        for color, percentage in zip(clustered_colors, clustered_percentages)
+        if percentage >= min_pixel_percentage
+    ]
+    print_colors([color for color, _ in kept], [percentage for _, percentage in kept])
+    return [color for color, _ in kept], [percentage for _, percentage in kept]
+
+def get_unique_colors_with_percentages(image, avg_difference_threshold=0, max_colors=math.inf, min_pixel_percentage=1.0, ignore_colors=None, scan_mode="full", frequency_engine="vectorized", reduction_mode="greedy", color_space="rgba", tile_rows=None, tile_workers=None):
+    """Like get_unique_colors, but also return each kept color's share of the non-ignored pixels.
+
+    tile_rows reads the image in strips of that many rows (converting each strip on its own), and
+    tile_workers counts the strips in that many worker processes. image may also be an RGBA pixel
+    array such as a memory-mapped .npy file, which is the only source read without ever holding
+    every pixel in memory.
+    """
+    check_reduction_options(reduction_mode, color_space)
+    if tile_rows is None:
+        image = to_rgba(image)
+
+    if ignore_colors is None:
+        ignore_colors = []
+
+    if reduction_mode != "greedy":
+        ignore_index = IgnoreColorIndex(ignore_colors, avg_difference_threshold)
+        return get_clustered_colors_with_percentages(image, ignore_index, max_colors, min_pixel_percentage, scan_mode, reduction_mode, color_space, tile_rows, tile_workers)
+
+    if frequency_engine not in FREQUENCY_ENGINES:
+        raise ValueError(f"Unknown frequency engine '{frequency_engine}', expected one of {list(FREQUENCY_ENGINES)}")
+
+    ignore_index = IgnoreColorIndex(ignore_colors, avg_difference_threshold)
+    count_frequencies = FREQUENCY_ENGINES[frequency_engine]
+    with instrumentation.timer("color frequencies"):
+        color_percentages, total_counted_pixels = count_frequencies(image, ignore_colors, avg_difference_threshold, scan_mode, ignore_index, tile_rows, tile_workers)
+    width, height = get_image_size(image)
+    print_pixel_analysis(width * (1 if scan_mode == "row" else height), total_counted_pixels)
+
     valid_colors = {
         color: percentage 
         for color, percentage in color_percentages.items() 
@@ -102,26 +547,187 @@ def get_unique_colors(image, avg_difference_threshold=0, max_colors=math.inf, mi
     }
 
     colors = list(valid_colors.keys())
+    instrumentation.count("colors considered", len(color_percentages))
 
     if len(colors) > max_colors:
         print(f"\nReducing from {len(colors)} colors to {max_colors} colors:")
-        colors = reduce_colors(colors, valid_colors, max_colors)
+        with instrumentation.timer("color reduction"):
+            colors = reduce_colors(colors, valid_colors, max_colors)
+
+    percentages = [color_percentages[color] for color in colors]
+    print_colors(colors, percentages)
+
+    return colors, percentages
 
-    for color in colors:
-        print(f"Color RGBA{color} ({color_percentages[color]:.2f}% of non-ignored pixels)")
+def open_palette_image(source, palette_path):
+    """Open a palette image lazily, failing with a clear message when it has more than Image.MAX_IMAGE_PIXELS pixels.
 
+    Image files are decoded whole even when scanned in tiles, so huge palettes are best converted
+    to an RGBA .npy file. Pillow's own limit is used as is, so callers raise it to open them anyway.
+    """
+    limit = Image.MAX_IMAGE_PIXELS
+    over_limit_message = (
+        f"Palette {palette_path} has more than Image.MAX_IMAGE_PIXELS ({limit}) pixels. Convert it to an "
+        "RGBA .npy file and scan that with tile_rows, or raise PIL.Image.MAX_IMAGE_PIXELS (None turns the check off)"
+    )
+    with warnings.catch_warnings():
+        # Pillow only warns between one and two times its limit; that range is refused below instead
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        try:
+            image = Image.open(source)
+        except Image.DecompressionBombError as e:
+            raise ValueError(over_limit_message) from e
+    if limit is not None and image.width * image.height > limit:
+        image.close()
+        raise ValueError(over_limit_message)
+    return image
+
+def load_palette_colors(
+    palette_path,
+    avg_difference_threshold=0,
+    max_colors=math.inf,
+    min_pixel_percentage=1.0,
+    ignore_colors=None,
+    scan_mode="full",
+    frequency_engine="vectorized",
+    cache_dir=None,
+    max_cache_bytes=palette_cache.DEFAULT_MAX_CACHE_BYTES,
+    reduction_mode="greedy",
+    color_space="rgba",
+    tile_rows=None,
+    tile_workers=None
+):
+    """Get the unique colors of a palette file, reusing a cached result when cache_dir is set.
+
+    A .npy file of RGBA pixels is scanned in place, strip by strip when tile_rows is set. When
+    scanning the whole image in tiles with cache_dir set, the decoded pixels are cached as .npy, so
+    later scans never decode the image and the first one frees it before counting.
+    """
+    check_reduction_options(reduction_mode, color_space)
+    extraction_options = (avg_difference_threshold, max_colors, min_pixel_percentage, ignore_colors, scan_mode, frequency_engine, reduction_mode, color_space, tile_rows, tile_workers)
+    if palette_path.endswith(".npy"):
+        return get_unique_colors(np.load(palette_path, mmap_mode='r'), *extraction_options)
+
+    if cache_dir is None:
+        with open_palette_image(palette_path, palette_path) as palette_image:
+            return get_unique_colors(palette_image, *extraction_options)
+
+    with open(palette_path, 'rb') as f:
+        image_bytes = f.read()
+    palette_image = open_palette_image(BytesIO(image_bytes), palette_path)
+
+    if scan_mode == "row" and palette_image.width == palette_image.height:
+        # The scan direction of a square palette is asked for interactively, so don't cache it
+        return get_unique_colors(palette_image, *extraction_options)
+
+    parameters = palette_cache.normalize_parameters(avg_difference_threshold, max_colors, min_pixel_percentage, ignore_colors, scan_mode, reduction_mode, color_space)
+    key = palette_cache.get_cache_key(image_bytes, parameters)
+    cached = palette_cache.load(cache_dir, key)
+    if cached is not None:
+        colors, percentages = cached
+        instrumentation.count("palette cache hits")
+        print(f"\nUsing cached palette analysis for {palette_path}")
+        print_colors(colors, percentages)
+        return colors
+
+    instrumentation.count("palette cache misses")
+
+    if tile_rows is not None and scan_mode != "row":
+        pixels = load_pixel_cache(palette_image, image_bytes, cache_dir, tile_rows)
+        # Drop the decoded image before scanning the cached pixels
+        palette_image.close()
+        palette_image = pixels
+
+    colors, percentages = get_unique_colors_with_percentages(palette_image, *extraction_options)
+    palette_cache.store(cache_dir, key, colors, percentages, max_cache_bytes)
     return colors
 
+def decode_to_pixel_file(image, pixels_path, tile_rows):
+    """Decode an image strip by strip into an RGBA .npy file and return it memory-mapped."""
+    width, height = get_image_size(image)
+
+    def write_pixels(f):
+        np.lib.format.write_array_header_1_0(f, {"descr": "|u1", "fortran_order": False, "shape": (height, width, 4)})
+        for strip in iter_rgba_strips(image, tile_rows):
+            f.write(strip.tobytes())
+
+    bulk_writer.write_file_atomic(pixels_path, write_pixels, 'wb')
+    return np.load(pixels_path, mmap_mode='r')
+
+def load_pixel_cache(image, image_bytes, cache_dir, tile_rows):
+    """Return a palette's decoded pixels memory-mapped from the cache, decoding them into it on a miss."""
+    pixels_path = palette_cache.get_pixels_path(cache_dir, image_bytes)
+    try:
+        # Mark the entry as recently used; another process may evict it at any point
+        os.utime(pixels_path)
+        pixels = np.load(pixels_path, mmap_mode='r')
+        instrumentation.count("pixel cache hits")
+        return pixels
+    except FileNotFoundError:
+        pass
+
+    instrumentation.count("pixel cache misses")
+    os.makedirs(cache_dir, exist_ok=True)
+    with instrumentation.timer("pixel cache decode"):
+        pixels = decode_to_pixel_file(image, pixels_path, tile_rows)
+    palette_cache.evict(cache_dir, palette_cache.DEFAULT_MAX_PIXEL_CACHE_BYTES, palette_cache.PIXELS_SUFFIX, keep=pixels_path)
+    return pixels
+
 def create_color_images(colors, size=(32, 32)):
     """Create a solid color image for each color in the list."""
     return [Image.new('RGBA', size, color) for color in colors]
 
-def output_images(images, output_path):
-    """Save all images to the specified directory."""
+def output_images(images, output_path, writer=None):
+    """Save all images to the specified directory, or queue them on a bulk_writer.BulkWriter."""
     os.makedirs(output_path, exist_ok=True)
     for i, image in enumerate(images):
-        image.save(os.path.join(output_path, f"{i}.png"))
-        print(f"Saved color {i}: RGBA{image.getpixel((0, 0))}")
+        image_path = os.path.join(output_path, f"{i}.png")
+        if writer is not None:
+            writer.save_image(image_path, image)
+        else:
+            image.save(image_path)
+            instrumentation.count("files written")
+            instrumentation.count("bytes written", os.path.getsize(image_path))
+        instrumentation.log_item(f"Saved color {i}: RGBA{image.getpixel((0, 0))}", i, len(images), "Saving colors")
+
+ATLAS_NAME = "atlas"
+
+def create_color_atlas(colors, cell_size=(32, 32), columns=None):
+    """Pack a solid cell per color into one image, returning (atlas, index) with each color's region."""
+    cell_width, cell_height = cell_size
+    if columns is None:
+        columns = max(1, math.ceil(math.sqrt(len(colors))))
+    rows = max(1, math.ceil(len(colors) / columns))
+    width, height = columns * cell_width, rows * cell_height
+
+    cells = np.zeros((rows * columns, 4), dtype=np.uint8)
+    cells[:len(colors)] = np.array(colors, dtype=np.uint8).reshape(-1, 4)
+    pixels = np.broadcast_to(cells.reshape(rows, 1, columns, 1, 4), (rows, cell_height, columns, cell_width, 4))
+    atlas = Image.fromarray(np.ascontiguousarray(pixels).reshape(height, width, 4), 'RGBA')
+
+    regions = []
+    for i, color in enumerate(colors):
+        x, y = (i % columns) * cell_width, (i // columns) * cell_height
+        regions.append({
+            "color": list(color),
+            # Pixel rect with a top-left origin, and the same region as UVs with a bottom-left origin
+            "rect": [x, y, cell_width, cell_height],
+            "uv": [x / width, 1 - (y + cell_height) / height, (x + cell_width) / width, 1 - y / height],
+        })
+    index = {"texture": ATLAS_NAME + ".png", "width": width, "height": height, "regions": regions}
+    return atlas, index
+
+def output_atlas(atlas, index, output_path):
+    """Save an atlas image and its color index to the specified directory."""
+    os.makedirs(output_path, exist_ok=True)
+    atlas_path = os.path.join(output_path, index["texture"])
+    atlas.save(atlas_path)
+    with open(os.path.join(output_path, ATLAS_NAME + ".json"), 'w') as f:
+        json.dump(index, f, indent=4)
+        instrumentation.count("bytes written", f.tell())
+    instrumentation.count("files written", 2)
+    instrumentation.count("bytes written", os.path.getsize(atlas_path))
+    print(f"Saved atlas of {len(index['regions'])} colors: {os.path.join(output_path, index['texture'])}")
 
 # Main function for direct execution
 def process_palette(
@@ -132,25 +738,52 @@ def process_palette(
     min_pixel_percentage=1.0,
     ignore_colors=None,
     image_size=(32, 32),
-    scan_mode="full"
+    scan_mode="full",
+    frequency_engine="vectorized",
+    cache_dir=None,
+    output_mode="images",
+    reduction_mode="greedy",
+    color_space="rgba",
+    tile_rows=None,
+    tile_workers=None,
+    writer=None
 ):
-    """Process a palette image and save unique colors as images."""
+    """Process a palette image and save unique colors as images, or as one atlas if output_mode is "atlas".
+
+    reduction_mode "greedy" drops the least distinct colors to meet max_colors; "median_cut" and
+    "kmeans" merge similar colors instead, in "rgba" or perceptual "lab" color_space.
+    tile_rows scans huge palettes in strips of that many rows, across tile_workers processes;
+    only .npy palettes are read without decoding every pixel at once.
+    With a writer, the color images are queued on it rather than written before returning.
+    Errors are reported and then re-raised, so callers building on the output can stop.
+    """
     try:
-        palette_image = Image.open(palette_path)
-        unique_colors = get_unique_colors(
-            palette_image,
+        unique_colors = load_palette_colors(
+            palette_path,
             avg_difference_threshold,
             max_colors,
             min_pixel_percentage,
             ignore_colors,
-            scan_mode
+            scan_mode,
+            frequency_engine,
+            cache_dir,
+            reduction_mode=reduction_mode,
+            color_space=color_space,
+            tile_rows=tile_rows,
+            tile_workers=tile_workers
         )
-        color_images = create_color_images(unique_colors, size=image_size)
-        output_images(color_images, output_path)
+        if output_mode == "atlas":
+            atlas, index = create_color_atlas(unique_colors, cell_size=image_size)
+            output_atlas(atlas, index, output_path)
+        else:
+            color_images = create_color_images(unique_colors, size=image_size)
+            output_images(color_images, output_path, writer)
     except FileNotFoundError:
         print(f"Error: Could not find palette file at {palette_path}")
+        raise
     except Exception as e:
         print(f"An error occurred: {str(e)}")
+        raise
 
 # Example usage for direct execution
 if __name__ == "__main__":
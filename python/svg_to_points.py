@@ -1,25 +1,296 @@
+import re
+import json
+import itertools
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Sample coordinates converted when no files are given
 data = "5571.810 1137.440, 5571.810 1137.440, 5571.450 1208.730, 5571.450 1208.730, 5571.450 1208.730, 7538.500 1210.500, 7538.500 1210.500, 7538.500 1210.500, 7637.940 1219.560, 7637.940 1219.560, 7637.940 1219.560, 7625.870 1165.300, 7625.870 1165.300, 7625.870 1165.300, 7255.050 1165.480, 7255.050 1165.480, 7255.050 1165.480, 7255.000 1158.450, 7255.000 1158.450, 7255.000 1158.450, 7657.060 1158.190, 7657.000 1158.190, 7656.940 1158.190, 7648.560 1127.000, 7648.560 1127.000, 7648.560 1127.000, 7587.090 456.730, 7587.090 456.730, 7587.090 456.730, 7332.500 456.620, 7332.380 456.620, 7332.250 456.620, 7332.000 448.750, 7332.000 448.750, 7332.000 448.750, 7586.270 449.640, 7586.270 449.640, 7586.270 449.640, 7584.820 394.270, 7584.820 394.270, 7584.820 394.270, 7619.180 370.090, 7619.180 370.090, 7619.180 370.090, 7619.820 330.090, 7619.820 330.090, 7619.820 330.090, 7635.910 320.090, 7635.910 320.090, 7635.910 320.090, 7636.180 311.910, 7636.090 311.910, 7636.000 311.910, 7581.450 304.820, 7581.450 304.820, 7581.450 304.820, 7566.500 50.690, 7566.500 50.690, 7566.500 50.690, 7239.000 50.640, 7239.000 50.640, 7239.000 50.640, 6935.090 289.820, 6935.090 289.820, 6935.090 289.820, 6758.250 288.750, 6758.250 288.750, 6758.250 288.750, 6592.750 311.250, 6592.750 311.250, 6592.750 311.250, 6573.360 326.640, 6573.360 326.820, 6573.360 327.000, 6573.640 344.550, 6573.730 344.550, 6573.820 344.550, 6591.820 359.270, 6591.910 359.270, 6592.000 359.270, 6698.000 377.000, 6698.000 377.000, 6698.000 377.000, 6721.450 389.640, 6721.450 389.640, 6721.450 389.640, 6732.550 405.640, 6732.550 405.640, 6732.550 405.640, 6735.450 425.090, 6735.450 425.090, 6735.450 425.090, 6731.250 442.380, 6731.250 442.380, 6731.250 442.380, 6722.360 454.090, 6722.360 454.090, 6722.360 454.090, 6685.820 486.360, 6685.820 486.360, 6685.820 486.360, 5977.450 1041.820, 5977.450 1041.820, 5977.450 1041.820, 5961.270 1053.820, 5961.270 1053.820, 5961.270 1053.820, 5914.910 1077.820, 5914.910 1077.820, 5914.910 1077.820, 5852.730 1103.820, 5852.730 1103.820, 5852.730 1103.820, 5793.820 1121.820, 5793.820 1121.820, 5793.820 1121.820, 5744.360 1131.270, 5744.360 1131.270, 5744.360 1131.270, 5666.270 1137.000, 5666.270 1137.000, 5666.270 1137.000, 5571.810 1137.440, 5571.810 1137.440"
 
-# Assuming the data is already in the variable 'data'
-coordinates = [tuple(map(float, pair.split())) for pair in data.split(',')]
+# Turns SVG paths, polylines, polygons or plain "x y, x y, ..." strings into part points for the game:
+# offset so the first point is at (0, 0), scaled, rounded and optionally simplified.
+# Run with no arguments to convert the sample data above, or pass .svg / text files.
+
+SCALE_FACTOR = 0.003
+DECIMALS = 4
+
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# Arc flags are single 0/1 characters that need no separator, as in optimizer output like "a5 5 0 0110 0"
+ARC_ARGUMENTS_PATTERN = re.compile(r"[\s,]*".join(
+    [f"({NUMBER_PATTERN.pattern})"] * 3 + [r"([01])"] * 2 + [f"({NUMBER_PATTERN.pattern})"] * 2
+))
+PATH_COMMAND_PATTERN = re.compile(r"([MmZzLlHhVvCcSsQqTtAa])([^MmZzLlHhVvCcSsQqTtAa]*)")
+
+# Numbers taken by one segment of each path command; the end point is always the last pair
+PATH_COMMAND_ARGUMENTS = {"M": 2, "L": 2, "T": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "A": 7}
+
+def parse_numbers(text):
+    """Parse every number in a string into a float array."""
+    return np.array(NUMBER_PATTERN.findall(text), dtype=np.float64)
+
+def parse_arc_arguments(text):
+    """Parse the arguments of arc commands into an (n, 7) array, reading each flag as one character."""
+    return np.array(ARC_ARGUMENTS_PATTERN.findall(text), dtype=np.float64).reshape(-1, 7)
+
+def parse_points(text):
+    """Parse a "x y, x y, ..." point string (or an SVG points attribute) into an (n, 2) array."""
+    numbers = parse_numbers(text)
+    return numbers[:len(numbers) // 2 * 2].reshape(-1, 2)
+
+def merge_path_commands(d):
+    """Split path data into (command, arguments), joining runs of the same command, which mean the same as one.
+
+    Runs of movetos are kept apart, since each one starts a new subpath.
+    """
+    for command, group in itertools.groupby(PATH_COMMAND_PATTERN.findall(d), key=lambda item: item[0]):
+        if command in "Mm":
+            yield from group
+        else:
+            yield command, " ".join(arguments for _, arguments in group)
+
+def parse_path(d):
+    """Parse SVG path data into one (n, 2) array per subpath. Curves and arcs only contribute their end points."""
+    subpaths = []
+    current = []
+    position = np.zeros(2)
+    start = np.zeros(2)
+
+    for command, arguments in merge_path_commands(d):
+        kind = command.upper()
+        if kind == "Z":
+            if current:
+                current.append(start[np.newaxis])
+                subpaths.append(np.concatenate(current))
+                current = []
+            position = start.copy()
+            continue
+
+        if kind == "A":
+            numbers = parse_arc_arguments(arguments)
+        else:
+            size = PATH_COMMAND_ARGUMENTS[kind]
+            numbers = parse_numbers(arguments)
+            numbers = numbers[:len(numbers) // size * size].reshape(-1, size)
+        if len(numbers) == 0:
+            continue
+
+        if kind == "H":
+            ends = np.column_stack((numbers[:, 0], np.zeros(len(numbers))))
+        elif kind == "V":
+            ends = np.column_stack((np.zeros(len(numbers)), numbers[:, 0]))
+        else:
+            ends = numbers[:, -2:]
+
+        if command != kind:
+            # Relative segments each start where the previous one ended
+            ends = position + np.cumsum(ends, axis=0)
+        elif kind == "H":
+            ends[:, 1] = position[1]
+        elif kind == "V":
+            ends[:, 0] = position[0]
+
+        if kind == "M":
+            if current:
+                subpaths.append(np.concatenate(current))
+                current = []
+            start = ends[0].copy()
+        elif not current:
+            # Drawing on after a closepath starts the new subpath where the closed one started
+            current.append(start[np.newaxis])
+        current.append(ends)
+        position = ends[-1].copy()
+
+    if current:
+        subpaths.append(np.concatenate(current))
+    return subpaths
+
+def parse_svg(text):
+    """Parse every path, polyline and polygon of an SVG document into (n, 2) arrays. Transforms are not applied."""
+    shapes = []
+    for element in ET.fromstring(text).iter():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "path":
+            shapes.extend(parse_path(element.get("d", "")))
+        elif tag in ("polyline", "polygon"):
+            points = parse_points(element.get("points", ""))
+            if tag == "polygon" and len(points):
+                points = np.concatenate((points, points[:1]))
+            if len(points):
+                shapes.append(points)
+    return shapes
+
+def parse_shapes(text):
+    """Parse an SVG document, or one path data or point string per line, into (n, 2) arrays."""
+    if text.lstrip().startswith("<"):
+        return parse_svg(text)
+
+    shapes = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line[:1] in ("M", "m"):
+            shapes.extend(parse_path(line))
+        elif line:
+            shapes.append(parse_points(line))
+    return shapes
+
+def round_values(values, decimals):
+    """Round an array exactly like Python's round(), which np.round can miss by one unit near halfway."""
+    rounded = np.round(values, decimals)
+    scaled = values * 10.0 ** decimals
+    # Only values within a few units in the last place of a half can come out differently
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.spacing(np.abs(scaled))
+    for index in np.flatnonzero(near_half):
+        rounded.flat[index] = round(float(values.flat[index]), decimals)
+    return rounded
+
+def transform_points(points, origin, scale_factor=SCALE_FACTOR, decimals=DECIMALS):
+    """Offset points by an origin, scale them and round them."""
+    return round_values((points - origin) * scale_factor, decimals)
+
+def remove_consecutive_duplicates(points):
+    """Drop points equal to the one before them."""
+    if len(points) < 2:
+        return points
+    return points[np.concatenate(([True], np.any(points[1:] != points[:-1], axis=1)))]
+
+def remove_duplicates(points):
+    """Drop points equal to any earlier point, keeping order."""
+    if len(points) < 2:
+        return points
+    _, first = np.unique(points, axis=0, return_index=True)
+    return points[np.sort(first)]
+
+def line_distances(points, start, end):
+    """Distance of each point from the line through start and end, or from start if the two coincide."""
+    direction = end - start
+    offsets = points - start
+    length = np.hypot(direction[0], direction[1])
+    if length == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+    return np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+
+def simplify_rdp(points, tolerance):
+    """Ramer-Douglas-Peucker: keep only the points needed to stay within tolerance of the original line."""
+    if len(points) < 3:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = line_distances(points[first + 1:last], points[first], points[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+def simplify_collinear(points, tolerance=0.0):
+    """Drop points within tolerance of the line through their neighbours, never two neighbours in the same pass."""
+    while len(points) > 2:
+        previous, middle, following = points[:-2], points[1:-1], points[2:]
+        direction = following - previous
+        offsets = middle - previous
+        lengths = np.hypot(direction[:, 0], direction[:, 1])
+        cross = np.abs(direction[:, 0] * offsets[:, 1] - direction[:, 1] * offsets[:, 0])
+        distances = np.where(lengths > 0, cross / np.where(lengths > 0, lengths, 1), np.hypot(offsets[:, 0], offsets[:, 1]))
+
+        candidates = distances <= tolerance
+        if not candidates.any():
+            break
+        # Drop every other point of each run of candidates, so every dropped point keeps both neighbours
+        index = np.arange(len(candidates))
+        run_starts = candidates & ~np.concatenate(([False], candidates[:-1]))
+        run_start_index = np.maximum.accumulate(np.where(run_starts, index, 0))
+        drop = candidates & ((index - run_start_index) % 2 == 0)
+        points = np.concatenate((points[:1], middle[~drop], points[-1:]))
+    return points
+
+SIMPLIFY_METHODS = {
+    "rdp": simplify_rdp,
+    "collinear": simplify_collinear,
+}
+
+def convert_shapes(shapes, scale_factor=SCALE_FACTOR, decimals=DECIMALS, simplify=None, tolerance=0.0):
+    """Offset every shape by the first point of the first one, scale, round, simplify and drop duplicate points.
+
+    tolerance is in output units, after scaling.
+    """
+    if not shapes:
+        return []
+    if simplify is not None and simplify not in SIMPLIFY_METHODS:
+        raise ValueError(f"Unknown simplification '{simplify}', expected one of {list(SIMPLIFY_METHODS)}")
+
+    # A shared origin keeps the shapes of one file aligned with each other
+    origin = shapes[0][0] if len(shapes[0]) else np.zeros(2)
+    converted = []
+    for points in shapes:
+        points = transform_points(points, origin, scale_factor, decimals)
+        if simplify is not None:
+            points = SIMPLIFY_METHODS[simplify](remove_consecutive_duplicates(points), tolerance)
+        converted.append(remove_duplicates(points))
+    return converted
+
+def convert_file(path, scale_factor=SCALE_FACTOR, decimals=DECIMALS, simplify=None, tolerance=0.0):
+    """Read and convert the shapes of one file. Runs inside a worker process for parallel conversions."""
+    with open(path) as f:
+        shapes = parse_shapes(f.read())
+    vertices = sum(len(points) for points in shapes)
+    return convert_shapes(shapes, scale_factor, decimals, simplify, tolerance), vertices
+
+def convert_files(paths, workers=None, **options):
+    """Convert many files, in a process pool when more than one worker is asked for, returning {path: (shapes, vertices)}."""
+    if workers is None or workers <= 1 or len(paths) < 2:
+        return {path: convert_file(path, **options) for path in paths}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(convert_file, path, **options) for path in paths}
+        return {path: future.result() for path, future in futures.items()}
+
+def print_points(points):
+    """Print points one (x, y) tuple per line."""
+    for coord in points.tolist():
+        print(tuple(coord))
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Convert SVG shapes or point strings into scaled part points.")
+    parser.add_argument("files", nargs="*", help=".svg files, or text files with one path data or point string per line; converts the sample data if omitted")
+    parser.add_argument("--scale", type=float, default=SCALE_FACTOR, help="scale factor applied after offsetting")
+    parser.add_argument("--decimals", type=int, default=DECIMALS, help="decimals to round to")
+    parser.add_argument("--simplify", choices=list(SIMPLIFY_METHODS), default=None, help="drop points that barely change the shape")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="largest allowed deviation when simplifying, in output units")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for converting several files")
+    parser.add_argument("--output", help="also write the points to this JSON file as {file: [[[x, y], ...], ...]}")
+    return parser.parse_args(argv)
 
-# Offset the coordinates so the first one is at (0, 0)
-first_x, first_y = coordinates[0]
-offset_coordinates = [(x - first_x, y - first_y) for x, y in coordinates]
+def main(argv=None):
+    args = parse_args(argv)
+    options = dict(scale_factor=args.scale, decimals=args.decimals, simplify=args.simplify, tolerance=args.tolerance)
 
-# Apply scale factor
-scale_factor = 0.003  # Example scale factor
-scaled_coordinates = [(round(x * scale_factor, 4), round(y * scale_factor, 4)) for x, y in offset_coordinates]
+    if not args.files:
+        for points in convert_shapes([parse_points(data)], **options):
+            print_points(points)
+        return
 
-# Remove duplicates by value, keeping order
-seen = set()
-unique_coordinates = []
-for coord in scaled_coordinates:
-    if coord not in seen:
-        unique_coordinates.append(coord)
-        seen.add(coord)
+    results = convert_files(args.files, args.workers, **options)
+    for path, (shapes, vertices) in results.items():
+        points_count = sum(len(points) for points in shapes)
+        print(f"# {path}: {len(shapes)} shapes, {vertices} vertices -> {points_count} points")
+        for i, points in enumerate(shapes):
+            print(f"# shape {i}: {len(points)} points")
+            print_points(points)
 
-# Displaying the result
-for coord in unique_coordinates:
-    print(coord)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({path: [points.tolist() for points in shapes] for path, (shapes, _) in results.items()}, f)
 
+if __name__ == "__main__":
+    main()
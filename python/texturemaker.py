@@ -1,5 +1,12 @@
 import os
+import re
+import copy
 import json
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+
+TEXTURE_PLACEHOLDER = "\0texture\0"
+NAME_PLACEHOLDER = "\0name\0"
 
 TEMPLATE =  '{  "colorTex": {    "textures": [      {        "texture": "Body.png",        "ideal": 0.0      }    ],    "border_Bottom": {      "uvSize": 0.0,      "sizeMode": 0,      "size": 0.5    },    "border_Top": {      "uvSize": 0.0,      "sizeMode": 0,      "size": 0.5    },    "center": {      "mode": 1,      "sizeMode": 0,      "size": 0.5,      "logoHeightPercent": 0.5,      "scaleLogoToFit": false    },    "fixedWidth": false,    "fixedWidthValue": 1,    "flipToLight_X": false,    "flipToLight_Y": false,    "metalTexture": false,    "icon": null  },  "tags": [    "fairing"  ],  "pack_Redstone_Atlas": true,  "multiple": false,  "segments": [],  "name": "A10Body",  "hideFlags": 0}'
 
@@ -10,13 +17,50 @@ def generate_texture_json(template, texture_filename, name):
     texture_data["name"] = name
     return texture_data
 
-def save_texture_json(output_path, filename, data):
-    """Save the texture JSON data to a file."""
+def save_texture_json(output_path, filename, data, writer=None):
+    """Save the texture JSON data to a file, or queue it on a bulk_writer.BulkWriter."""
     os.makedirs(output_path, exist_ok=True)
     filepath = os.path.join(output_path, filename + ".json")
+    if writer is not None:
+        writer.write_text(filepath, json.dumps(data, indent=4))
+    else:
+        with open(filepath, 'w') as f:
+            json.dump(data, f, indent=4)
+            instrumentation.count("bytes written", f.tell())
+        instrumentation.count("files written")
+    instrumentation.log_item(f"Saved: {filepath}")
+
+def compile_texture_template(template):
+    """Parse and render a template once, returning a function that stamps out texture JSON text."""
+    rendered = json.dumps(generate_texture_json(template, TEXTURE_PLACEHOLDER, NAME_PLACEHOLDER), indent=4)
+    texture_slot = json.dumps(TEXTURE_PLACEHOLDER)
+    name_slot = json.dumps(NAME_PLACEHOLDER)
+    pieces = re.split(f"({re.escape(texture_slot)}|{re.escape(name_slot)})", rendered)
+
+    def render(texture_filename, name):
+        values = {texture_slot: json.dumps(texture_filename), name_slot: json.dumps(name)}
+        return "".join(values.get(piece, piece) for piece in pieces)
+
+    return render
+
+def write_if_changed(filepath, text, writer=None):
+    """Write text to a file (or queue it on a writer) unless it already holds exactly that text. Returns True if written."""
+    try:
+        with open(filepath) as f:
+            instrumentation.count("files read")
+            if f.read() == text:
+                instrumentation.count("files unchanged")
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    if writer is not None:
+        writer.write_text(filepath, text)
+        return True
     with open(filepath, 'w') as f:
-        json.dump(data, f, indent=4)
-    print(f"Saved: {filepath}")
+        f.write(text)
+        instrumentation.count("bytes written", f.tell())
+    instrumentation.count("files written")
+    return True
 
 def remove_extension(filename):
     """Remove the file extension from a filename."""
@@ -26,7 +70,8 @@ def process_textures(
     input_folder,
     output_folder,
     texture_name_function=lambda x: x,
-    template=TEMPLATE
+    template=TEMPLATE,
+    writer=None
 ):
     """Process all PNG files in the input folder to create JSON files in the output folder."""
     for filename in os.listdir(input_folder):
@@ -34,7 +79,69 @@ def process_textures(
             base_name = remove_extension(filename)
             texture_name = texture_name_function(filename)
             texture_json = generate_texture_json(template, filename, texture_name)
-            save_texture_json(output_folder, base_name, texture_json)
+            save_texture_json(output_folder, base_name, texture_json, writer)
+
+def process_textures_bulk(
+    input_folder,
+    output_folder,
+    texture_name_function=lambda x: x,
+    template=TEMPLATE,
+    workers=None
+):
+    """Same output as process_textures, but renders the template once and writes on a thread pool."""
+    render = compile_texture_template(template)
+    os.makedirs(output_folder, exist_ok=True)
+
+    jobs = []
+    texture_names = []
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(".png"):
+                texture_name = texture_name_function(entry.name)
+                filepath = os.path.join(output_folder, remove_extension(entry.name) + ".json")
+                jobs.append((filepath, render(entry.name, texture_name)))
+                texture_names.append(texture_name)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        written = sum(executor.map(lambda job: write_if_changed(*job), jobs))
+
+    print(f"Saved {written} texture files to {output_folder} ({len(jobs) - written} unchanged)")
+    return texture_names
+
+def load_atlas_index(index_path):
+    """Load the color index written next to a palette atlas."""
+    with open(index_path) as f:
+        return json.load(f)
+
+def process_atlas(
+    atlas_index,
+    output_folder,
+    texture_name_function=lambda x: x,
+    template=TEMPLATE,
+    writer=None
+):
+    """Create one texture JSON per atlas region, each pointing at the atlas with the region's UV rect.
+
+    Experimental: uvRect is not part of the stock template, and whether the game reads it (and with
+    which origin) is unconfirmed. If it doesn't, every region renders the whole atlas.
+    """
+    base = json.loads(template)
+    os.makedirs(output_folder, exist_ok=True)
+
+    records = []
+    for i, region in enumerate(atlas_index["regions"]):
+        texture_name = texture_name_function(f"{i}.png")
+        texture_data = copy.deepcopy(base)
+        texture = texture_data["colorTex"]["textures"][0]
+        texture["texture"] = atlas_index["texture"]
+        u_min, v_min, u_max, v_max = region["uv"]
+        texture["uvRect"] = {"x": u_min, "y": v_min, "width": u_max - u_min, "height": v_max - v_min}
+        texture_data["name"] = texture_name
+        write_if_changed(os.path.join(output_folder, f"{i}.json"), json.dumps(texture_data, indent=4), writer)
+        records.append((f"{i}.json", texture_name))
+
+    print(f"Saved {len(records)} atlas texture files to {output_folder}")
+    return records
 
 def get_texture_template():
     return TEMPLATE
@@ -1,9 +1,21 @@
-import palettemaker
+# palettemaker (numpy) and PIL are imported by the functions that need them, so runs that only
+# write JSON or blueprints start quickly
 import texturemaker
 import paletteblueprintmaker
+import palette_cache
+import instrumentation
+import bulk_writer
 import os
+import sys
 import json
 import math
+import hashlib
+import time
+import argparse
+import traceback
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
 # Path to the game directory
 GAME_PATH = "C:\\Program Files (x86)\\Steam\\steamapps\\common\\Spaceflight Simulator\\Spaceflight Simulator Game"
@@ -15,6 +27,17 @@ BP_PATH = GAME_PATH + "\\Saving\\Blueprints"
 TEXTURE_PACK_NAME = "Kuromi X"
 MAKE_BP = True
 IN_BP_PATH_OR_SAVING = True # false will output to the texture pack folder, true will output to the Saving/Blueprints folder
+PIPELINE = True # true builds textures, texture JSONs and blueprint parts in one pass without reading back written files
+CACHE_PALETTE = True # true reuses the palette analysis of an earlier run when the palette and settings are unchanged
+OUTPUT_MODE = "progress" # "verbose" prints every file and color, "progress" shows progress bars, "quiet" prints neither
+REPORT_FORMAT = "table" # how timers and counters are reported at the end of a build: "table", "json" or None
+PROFILE = False # true runs the build under cProfile and prints the hottest functions
+TRACE_MEMORY = False # true traces allocations with tracemalloc and prints the peak and biggest allocation sites
+TILE_ROWS = None # e.g. 1024 scans huge palettes in strips of that many rows; memory only follows the strip size for .npy palettes (or once the pixel cache holds the palette), image files are still decoded whole
+TILE_WORKERS = None # number of worker processes counting strips when TILE_ROWS is set
+INCREMENTAL = False # true updates an existing pack in place, only touching the textures and blueprint parts of colors that changed since the last incremental build
+EXPERIMENTAL_ATLAS = False # true allows output_mode="atlas"; the game may ignore its uvRect field and render the whole atlas for every color, so check packs in-game
+WRITE_WORKERS = 8 # files written at the same time in the background, so slow or networked drives don't hold up the build
 PROJECTS_PATH = "E:\\SFS\\SFS Projects\\Creation Projects"
 PALETTE_PATH = os.path.join(PROJECTS_PATH, TEXTURE_PACK_NAME, "palette.png")
 
@@ -22,6 +45,9 @@ PALETTE_PATH = os.path.join(PROJECTS_PATH, TEXTURE_PACK_NAME, "palette.png")
 
 TEXTURE_PACK_PATH = TEXTURES_PATH + "\\" + TEXTURE_PACK_NAME
 
+# Colors, texture ids and texture hashes of the last build, kept in the pack folder
+BUILD_MANIFEST_NAME = ".palette_build.json"
+
 
 folders = [
     "Color Textures",
@@ -47,7 +73,7 @@ default_pack_info = {
 
 
 def get_pack_info(display_name, version=default_version, description=default_description, author=default_author):
-    pack_info = default_pack_info
+    pack_info = dict(default_pack_info)
     pack_info["DisplayName"] = display_name
     pack_info["Version"] = version
     pack_info["Description"] = description
@@ -71,56 +97,487 @@ DEFAULT_IGNORE_COLORS = [
     (0, 0, 0, 0)
 ]
 
-def add_texture_pack_name_fn_prefix(texture_name):
-    return TEXTURE_PACK_NAME + "-" + str(texturemaker.remove_extension(texture_name))
+def make_texture_name_function(texture_pack_name):
+    """Return a texture name function that prefixes names with the given pack name."""
+    def add_prefix(texture_name):
+        return texture_pack_name + "-" + str(texturemaker.remove_extension(texture_name))
+    return add_prefix
 
-def main():    
-    pack_info = get_pack_info(TEXTURE_PACK_NAME)
-    make_texture_pack(TEXTURE_PACK_NAME, TEXTURE_PACK_PATH, pack_info)
-    
-    palettemaker.process_palette(
-        palette_path=PALETTE_PATH,
-        output_path=TEXTURE_PACK_PATH + "\\Textures",
-        avg_difference_threshold=0,
-        max_colors=math.inf,
-        min_pixel_percentage=1.0,
-        ignore_colors=DEFAULT_IGNORE_COLORS,
-        image_size=(1, 1),
-        scan_mode="row"
+def stream_palette_textures(
+    palette_path,
+    texture_pack_path,
+    texture_name_function,
+    avg_difference_threshold=0,
+    max_colors=math.inf,
+    min_pixel_percentage=1.0,
+    ignore_colors=None,
+    image_size=(1, 1),
+    scan_mode="row",
+    cache_dir=None,
+    reduction_mode="greedy",
+    color_space="rgba",
+    tile_rows=None,
+    tile_workers=None,
+    writer=None
+):
+    """Extract palette colors and write each one's PNG and texture JSON, yielding (json filename, texture name, color, PNG hash)."""
+    import palettemaker
+    colors = palettemaker.load_palette_colors(
+        palette_path,
+        avg_difference_threshold,
+        max_colors,
+        min_pixel_percentage,
+        ignore_colors,
+        scan_mode,
+        cache_dir=cache_dir,
+        reduction_mode=reduction_mode,
+        color_space=color_space,
+        tile_rows=tile_rows,
+        tile_workers=tile_workers
     )
-    print(f"Palette processed at {PALETTE_PATH}")
-    
-    texturemaker.process_textures(
-        input_folder=TEXTURE_PACK_PATH + "\\Textures",
-        output_folder=TEXTURE_PACK_PATH + "\\Color Textures",
-        texture_name_function=add_texture_pack_name_fn_prefix
+
+    os.makedirs(os.path.join(texture_pack_path, "Textures"), exist_ok=True)
+    os.makedirs(os.path.join(texture_pack_path, "Color Textures"), exist_ok=True)
+    render_texture_json = texturemaker.compile_texture_template(texturemaker.get_texture_template())
+
+    for i, color in enumerate(colors):
+        texture_name, digest = write_color_texture(texture_pack_path, i, color, texture_name_function, render_texture_json, image_size, writer)
+        instrumentation.log_item(f"Saved color {i}: RGBA{color}", i, len(colors), "Writing textures")
+        yield f"{i}.json", texture_name, color, digest
+
+def write_color_texture(texture_pack_path, texture_id, color, texture_name_function, render_texture_json, image_size=(1, 1), writer=None):
+    """Write the PNG and texture JSON of one color under the given id, returning (texture name, PNG hash)."""
+    from PIL import Image
+    texture_filename = f"{texture_id}.png"
+    texture_path = os.path.join(texture_pack_path, "Textures", texture_filename)
+    # Encoded here rather than on the writer so the build manifest can record what was written
+    buffer = BytesIO()
+    Image.new('RGBA', image_size, color).save(buffer, format="PNG")
+    data = buffer.getvalue()
+    if writer is not None:
+        writer.submit(texture_path, lambda f: f.write(data), 'wb')
+    else:
+        with open(texture_path, 'wb') as f:
+            f.write(data)
+        instrumentation.count("files written")
+        instrumentation.count("bytes written", len(data))
+    texture_name = texture_name_function(texture_filename)
+    texturemaker.write_if_changed(
+        os.path.join(texture_pack_path, "Color Textures", f"{texture_id}.json"),
+        render_texture_json(texture_filename, texture_name),
+        writer
     )
-    print(f"Textures processed at {TEXTURE_PACK_PATH + '\\Textures'}")
-    
-    bp = paletteblueprintmaker.create_palette_blueprint(
-        input_texture_path=TEXTURE_PACK_PATH + "\\Color Textures"
+    return texture_name, hashlib.sha256(data).hexdigest()
+
+def remove_color_texture(texture_pack_path, texture_id):
+    """Delete the PNG and texture JSON of one color id, if they exist."""
+    for path in (
+        os.path.join(texture_pack_path, "Textures", f"{texture_id}.png"),
+        os.path.join(texture_pack_path, "Color Textures", f"{texture_id}.json")
+    ):
+        try:
+            os.remove(path)
+            instrumentation.count("files removed")
+        except FileNotFoundError:
+            pass
+
+def remove_stale_textures(texture_pack_path, first_unused_id):
+    """Delete numbered color textures from earlier builds whose ids are no longer in use."""
+    for folder, extension in (("Textures", ".png"), ("Color Textures", ".json")):
+        with os.scandir(os.path.join(texture_pack_path, folder)) as entries:
+            stale = [
+                entry.path for entry in entries
+                if entry.name.endswith(extension)
+                and entry.name[:-len(extension)].isdigit()
+                and int(entry.name[:-len(extension)]) >= first_unused_id
+            ]
+        for path in stale:
+            os.remove(path)
+            instrumentation.count("files removed")
+
+def color_key(color):
+    """Return the hex key a color is recorded under in the build manifest."""
+    return "".join(f"{channel:02x}" for channel in color)
+
+def load_build_manifest(texture_pack_path):
+    """Load the colors and texture ids recorded by the pack's last build, or None."""
+    try:
+        with open(os.path.join(texture_pack_path, BUILD_MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_build_manifest(texture_pack_path, manifest, writer=None):
+    """Record the pack's colors and texture ids for the next incremental build."""
+    texturemaker.write_if_changed(os.path.join(texture_pack_path, BUILD_MANIFEST_NAME), json.dumps(manifest, indent=4), writer)
+
+def remove_build_manifest(texture_pack_path):
+    """Delete the pack's build manifest, so the next incremental build rewrites every color."""
+    try:
+        os.remove(os.path.join(texture_pack_path, BUILD_MANIFEST_NAME))
+    except FileNotFoundError:
+        pass
+
+def get_file_stamp(path):
+    """Return a file's modification time and size, which change whenever it is rewritten."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def is_build_manifest_current(texture_pack_path, manifest, pack_name, image_size):
+    """Check that a build manifest belongs to this pack and every texture it records is on disk unchanged.
+
+    Textures are only stat'ed; a PNG is read and hashed only when its stamp differs from the one
+    recorded, e.g. just after it was written, and the manifest then records its new stamp.
+    """
+    if manifest is None or manifest.get("name") != pack_name or manifest.get("image_size") != list(image_size):
+        return False
+    try:
+        for entry in manifest["textures"].values():
+            if not os.path.exists(os.path.join(texture_pack_path, "Color Textures", f"{entry['id']}.json")):
+                return False
+            texture_path = os.path.join(texture_pack_path, "Textures", f"{entry['id']}.png")
+            stamp = get_file_stamp(texture_path)
+            if entry.get("stamp") == stamp:
+                continue
+            with open(texture_path, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+                    return False
+            entry["stamp"] = stamp
+            instrumentation.count("textures rehashed")
+    except (OSError, KeyError, TypeError, AttributeError):
+        return False
+    return True
+
+def update_pack_textures(palette_path, texture_pack_path, texture_name_function, pack_name, image_size=(1, 1), writer=None, **extraction_options):
+    """Bring the pack's color textures up to date with the palette, only touching colors added or removed since the last build.
+
+    Unchanged colors keep their texture ids and names; new colors get ids never used before. Without a
+    matching build manifest, or if any texture it records is missing or changed on disk, every color
+    is rewritten, numbered from 0 like a full build.
+    Returns (texture names in blueprint order, added names, removed names, rebuilt).
+    """
+    import palettemaker
+    colors = palettemaker.load_palette_colors(palette_path, **extraction_options)
+    manifest = load_build_manifest(texture_pack_path)
+    rebuilt = not is_build_manifest_current(texture_pack_path, manifest, pack_name, image_size)
+    if rebuilt:
+        manifest = {"name": pack_name, "image_size": list(image_size), "next_id": 0, "textures": {}}
+
+    old_textures = manifest["textures"]
+    new_colors = {color_key(color): color for color in colors}
+
+    removed = []
+    for key, entry in old_textures.items():
+        if key not in new_colors:
+            remove_color_texture(texture_pack_path, entry["id"])
+            removed.append(texture_name_function(f"{entry['id']}.png"))
+
+    os.makedirs(os.path.join(texture_pack_path, "Textures"), exist_ok=True)
+    os.makedirs(os.path.join(texture_pack_path, "Color Textures"), exist_ok=True)
+    render_texture_json = texturemaker.compile_texture_template(texturemaker.get_texture_template())
+
+    textures = {}
+    added = []
+    added_colors = [key for key in new_colors if key not in old_textures]
+    for key, color in new_colors.items():
+        if key in old_textures:
+            textures[key] = old_textures[key]
+            continue
+        texture_id = manifest["next_id"]
+        manifest["next_id"] += 1
+        texture_name, digest = write_color_texture(texture_pack_path, texture_id, color, texture_name_function, render_texture_json, image_size, writer)
+        textures[key] = {"id": texture_id, "sha256": digest}
+        added.append(texture_name)
+        instrumentation.log_item(f"Saved color {texture_id}: RGBA{color}", len(added) - 1, len(added_colors), "Writing textures")
+
+    if rebuilt:
+        remove_stale_textures(texture_pack_path, manifest["next_id"])
+    manifest["textures"] = textures
+    save_build_manifest(texture_pack_path, manifest, writer)
+
+    instrumentation.count("textures added", len(added))
+    instrumentation.count("textures removed", len(removed))
+    instrumentation.count("textures unchanged", len(textures) - len(added))
+    print(f"Palette processed at {palette_path} ({len(added)} textures added, {len(removed)} removed, {len(textures) - len(added)} unchanged)")
+
+    # Same part order create_palette_blueprint reads the Color Textures folder back in
+    texture_ids = sorted((entry["id"] for entry in textures.values()), key=lambda texture_id: f"{texture_id}.json")
+    texture_names = [texture_name_function(f"{texture_id}.png") for texture_id in texture_ids]
+    return texture_names, added, removed, rebuilt
+
+def build_pack_pipeline(palette_path, texture_pack_path, texture_name_function, pack_name, image_size=(1, 1), writer=None, **extraction_options):
+    """Build the pack's textures and texture JSONs in one pass and return the texture names in blueprint order.
+
+    The ids it assigns are recorded in the build manifest, so a later incremental build can carry on from them.
+    """
+    records = list(stream_palette_textures(palette_path, texture_pack_path, texture_name_function, image_size=image_size, writer=writer, **extraction_options))
+    print(f"Palette processed at {palette_path} ({len(records)} textures written to {texture_pack_path})")
+
+    textures = {color_key(color): {"id": i, "sha256": digest} for i, (_, _, color, digest) in enumerate(records)}
+    save_build_manifest(texture_pack_path, {"name": pack_name, "image_size": list(image_size), "next_id": len(records), "textures": textures}, writer)
+
+    # Same part order create_palette_blueprint reads the Color Textures folder back in
+    return [texture_name for _, texture_name, _, _ in sorted(records, key=lambda record: record[0])]
+
+def build_pack_atlas(palette_path, texture_pack_path, texture_name_function, image_size=(1, 1), cache_dir=None, writer=None, **extraction_options):
+    """Build the pack's colors as a single atlas plus region texture JSONs and return the texture names in blueprint order."""
+    import palettemaker
+    colors = palettemaker.load_palette_colors(palette_path, cache_dir=cache_dir, **extraction_options)
+    atlas, index = palettemaker.create_color_atlas(colors, cell_size=image_size)
+    palettemaker.output_atlas(atlas, index, os.path.join(texture_pack_path, "Textures"))
+
+    records = texturemaker.process_atlas(index, os.path.join(texture_pack_path, "Color Textures"), texture_name_function, writer=writer)
+    return [texture_name for _, texture_name in sorted(records)]
+
+def get_blueprint_path(texture_pack_name, texture_pack_path, in_bp_path_or_saving=IN_BP_PATH_OR_SAVING):
+    """Return the folder a pack's palette blueprint is written to."""
+    if in_bp_path_or_saving:
+        return os.path.join(BP_PATH, texture_pack_name + " Palette")
+    return os.path.join(texture_pack_path, "Palette")
+
+@contextmanager
+def time_stage(timings, stage):
+    """Record how long the enclosed block takes under timings[stage] and the matching instrumentation timer."""
+    start = time.perf_counter()
+    try:
+        with instrumentation.timer("stage: " + stage):
+            yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+def build_texture_pack(
+    texture_pack_name,
+    palette_path,
+    texture_pack_path=None,
+    make_bp=MAKE_BP,
+    in_bp_path_or_saving=IN_BP_PATH_OR_SAVING,
+    pipeline=PIPELINE,
+    output_mode="images",
+    version=default_version,
+    description=default_description,
+    author=default_author,
+    avg_difference_threshold=0,
+    max_colors=math.inf,
+    min_pixel_percentage=1.0,
+    ignore_colors=DEFAULT_IGNORE_COLORS,
+    image_size=(1, 1),
+    scan_mode="row",
+    cache_dir=None,
+    reduction_mode="greedy",
+    color_space="rgba",
+    tile_rows=TILE_ROWS,
+    tile_workers=TILE_WORKERS,
+    write_workers=WRITE_WORKERS,
+    incremental=INCREMENTAL,
+    experimental_atlas=EXPERIMENTAL_ATLAS,
+    timings=None
+):
+    """Build one texture pack from a palette image and return the time spent in each stage.
+
+    output_mode "atlas" is experimental and needs experimental_atlas: the uvRect field its texture
+    JSONs rely on has not been confirmed to work in the game.
+    """
+    if output_mode == "atlas" and not experimental_atlas:
+        raise ValueError("Atlas packs are experimental (the game may ignore uvRect); pass experimental_atlas=True to build one anyway")
+    if texture_pack_path is None:
+        texture_pack_path = os.path.join(TEXTURES_PATH, texture_pack_name)
+    texture_name_function = make_texture_name_function(texture_pack_name)
+    palette_options = dict(
+        avg_difference_threshold=avg_difference_threshold,
+        max_colors=max_colors,
+        min_pixel_percentage=min_pixel_percentage,
+        ignore_colors=ignore_colors,
+        image_size=image_size,
+        scan_mode=scan_mode,
+        cache_dir=cache_dir,
+        reduction_mode=reduction_mode,
+        color_space=color_space,
+        tile_rows=tile_rows,
+        tile_workers=tile_workers
     )
+    timings = {} if timings is None else timings
 
-    if not MAKE_BP:
-        return
+    with time_stage(timings, "pack"):
+        pack_info = get_pack_info(texture_pack_name, version, description, author)
+        make_texture_pack(texture_pack_name, texture_pack_path, pack_info)
 
-    if IN_BP_PATH_OR_SAVING:
-        bp_path = os.path.join(BP_PATH, TEXTURE_PACK_NAME + " Palette")
-    else:
-        bp_path = os.path.join(TEXTURE_PACK_PATH, "Palette")
+    # Files are written in the background while the next ones are computed; anything read back
+    # from disk is flushed first
+    with bulk_writer.BulkWriter(write_workers) as writer:
+        rebuilt = True
+        if incremental:
+            if output_mode == "atlas":
+                raise ValueError("Incremental builds need one texture per color, not an atlas")
+            with time_stage(timings, "palette+textures"):
+                texture_names, added, removed, rebuilt = update_pack_textures(
+                    palette_path, texture_pack_path, texture_name_function, texture_pack_name, writer=writer, **palette_options
+                )
+        elif output_mode == "atlas":
+            # The atlas replaces the numbered textures a build manifest points at
+            remove_build_manifest(texture_pack_path)
+            with time_stage(timings, "palette+textures"):
+                texture_names = build_pack_atlas(palette_path, texture_pack_path, texture_name_function, writer=writer, **palette_options)
+        elif pipeline:
+            with time_stage(timings, "palette+textures"):
+                texture_names = build_pack_pipeline(palette_path, texture_pack_path, texture_name_function, texture_pack_name, writer=writer, **palette_options)
+        else:
+            textures_path = os.path.join(texture_pack_path, "Textures")
+            color_textures_path = os.path.join(texture_pack_path, "Color Textures")
+            # The colors behind the rewritten textures are never seen here, so a later incremental build starts over
+            remove_build_manifest(texture_pack_path)
 
-    if not os.path.exists(bp_path):
-        os.makedirs(bp_path)
-    else:
-        raise FileExistsError(f"Blueprint with this name ({bp_path}) already exists, not overwriting, at the path {bp_path}")
-    
-    with open(os.path.join(bp_path, "Blueprint.txt"), 'w') as f:
-        f.write(json.dumps(bp, indent=4))
+            with time_stage(timings, "palette"):
+                import palettemaker
+                palettemaker.process_palette(palette_path=palette_path, output_path=textures_path, writer=writer, **palette_options)
+                writer.flush()
+                print(f"Palette processed at {palette_path}")
 
-    with open(os.path.join(bp_path, "Version.txt"), 'w') as f:
-        f.write("1.5.10.2")
+            with time_stage(timings, "textures"):
+                texturemaker.process_textures(
+                    input_folder=textures_path,
+                    output_folder=color_textures_path,
+                    texture_name_function=texture_name_function,
+                    writer=writer
+                )
+                writer.flush()
+                print(f"Textures processed at {textures_path}")
+
+            with time_stage(timings, "blueprint"):
+                texture_names = paletteblueprintmaker.get_all_texture_names(color_textures_path)
+
+        if make_bp:
+            with time_stage(timings, "blueprint write"):
+                bp_path = get_blueprint_path(texture_pack_name, texture_pack_path, in_bp_path_or_saving)
+
+                blueprint_path = os.path.join(bp_path, "Blueprint.txt")
+                if incremental and not rebuilt and os.path.exists(blueprint_path):
+                    if added or removed:
+                        paletteblueprintmaker.patch_blueprint(blueprint_path, added, removed, writer)
+                        blueprint_status = "updated"
+                    else:
+                        blueprint_status = "unchanged"
+                else:
+                    if not os.path.exists(bp_path):
+                        os.makedirs(bp_path)
+                    elif not incremental:
+                        raise FileExistsError(f"Blueprint with this name ({bp_path}) already exists, not overwriting, at the path {bp_path}")
+
+                    parts = paletteblueprintmaker.iter_palette_parts(texture_names)
+                    paletteblueprintmaker.write_blueprint(blueprint_path, parts, writer)
+                    writer.write_text(os.path.join(bp_path, "Version.txt"), "1.5.10.2")
+                    blueprint_status = "created"
+
+        with time_stage(timings, "flush"):
+            writer.flush()
+
+    if make_bp:
+        print(f"Blueprint {blueprint_status} at {bp_path}")
+
+    return timings
+
+def main(output_mode=OUTPUT_MODE, report_format=REPORT_FORMAT, profile=PROFILE, trace_memory=TRACE_MEMORY, incremental=INCREMENTAL):
+    cache_dir = palette_cache.DEFAULT_CACHE_DIR if CACHE_PALETTE else None
+    instrumentation.set_output_mode(output_mode)
+    with instrumentation.capture(profile, trace_memory):
+        build_texture_pack(TEXTURE_PACK_NAME, PALETTE_PATH, TEXTURE_PACK_PATH, cache_dir=cache_dir, incremental=incremental)
+    if report_format:
+        instrumentation.report(report_format)
+
+def load_pack_manifest(manifest_path):
+    """Load a batch manifest: a JSON list (or {"packs": [...]}) of {"name", "palette_path", "options"}."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    packs = manifest["packs"] if isinstance(manifest, dict) else manifest
+
+    for pack in packs:
+        options = pack.setdefault("options", {})
+        # JSON has no tuples or infinity
+        if options.get("ignore_colors") is not None:
+            options["ignore_colors"] = [tuple(color) for color in options["ignore_colors"]]
+        if "image_size" in options:
+            options["image_size"] = tuple(options["image_size"])
+        if "max_colors" in options and options["max_colors"] is None:
+            options["max_colors"] = math.inf
+    return packs
+
+def build_manifest_pack(pack, output_mode="quiet"):
+    """Build one manifest entry, catching its error so the rest of the batch carries on."""
+    # Worker processes are reused across packs, so each pack starts from fresh totals
+    instrumentation.reset()
+    instrumentation.set_output_mode(output_mode)
+    start = time.perf_counter()
+    result = {"name": pack["name"], "timings": {}, "error": None}
+    try:
+        build_texture_pack(pack["name"], pack["palette_path"], timings=result["timings"], **pack.get("options", {}))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["total"] = time.perf_counter() - start
+    result["instrumentation"] = instrumentation.snapshot()
+    return result
+
+def print_batch_summary(results, elapsed):
+    """Print per-pack stage timings followed by any errors."""
+    stages = []
+    for result in results:
+        for stage in result["timings"]:
+            if stage not in stages:
+                stages.append(stage)
+
+    header = ["pack", "status"] + stages + ["total"]
+    rows = [
+        [result["name"], "failed" if result["error"] else "ok"]
+        + [f"{result['timings'][stage]:.2f}s" if stage in result["timings"] else "-" for stage in stages]
+        + [f"{result['total']:.2f}s"]
+        for result in results
+    ]
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+
+    print("\nBatch summary:")
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+    failed = [result for result in results if result["error"]]
+    for result in failed:
+        print(f"\n{result['name']} failed: {result['error']}")
+    print(f"\nBuilt {len(results) - len(failed)}/{len(results)} packs in {elapsed:.2f}s")
+
+def build_texture_packs(packs, workers=None, output_mode="quiet", report_format=REPORT_FORMAT):
+    """Build many texture packs concurrently in a process pool, returning one result per pack."""
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(build_manifest_pack, packs, [output_mode] * len(packs)))
+    print_batch_summary(results, time.perf_counter() - start)
+
+    if report_format:
+        instrumentation.reset()
+        for result in results:
+            instrumentation.merge(result["instrumentation"])
+        instrumentation.report(report_format)
+    return results
+
+def parse_args(argv=None):
+    """Parse the command line for single or batch builds."""
+    parser = argparse.ArgumentParser(description="Build texture packs from palette images.")
+    parser.add_argument("--manifest", help="JSON manifest of packs to build in a batch; builds TEXTURE_PACK_NAME if omitted")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes for a batch build")
+    parser.add_argument("--output-mode", choices=instrumentation.OUTPUT_MODES, default=None, help="per-item output (default: OUTPUT_MODE, or quiet for batches)")
+    parser.add_argument("--report", choices=["table", "json", "none"], default=REPORT_FORMAT or "none", help="format of the timers and counters report")
+    parser.add_argument("--profile", action="store_true", default=PROFILE, help="run under cProfile")
+    parser.add_argument("--trace-memory", action="store_true", default=TRACE_MEMORY, help="trace allocations with tracemalloc")
+    parser.add_argument("--incremental", action="store_true", default=INCREMENTAL, help="update TEXTURE_PACK_NAME in place, only touching colors that changed")
+    return parser.parse_args(argv)
 
-    print(f"Blueprint created at {BP_PATH}")
-    
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    report_format = None if args.report == "none" else args.report
+    if args.manifest:
+        with instrumentation.capture(args.profile, args.trace_memory):
+            results = build_texture_packs(
+                load_pack_manifest(args.manifest),
+                workers=args.workers,
+                output_mode=args.output_mode or "quiet",
+                report_format=report_format
+            )
+        sys.exit(1 if any(result["error"] for result in results) else 0)
+    main(args.output_mode or OUTPUT_MODE, report_format, args.profile, args.trace_memory, args.incremental)